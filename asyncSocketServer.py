@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import threading
+
+from serverCore import ServerCore
+from clientChannel import ClientChannel
+from telemetryAggregator import TelemetryAggregator
+
+logger = logging.getLogger()
+
+
+class _Connection(asyncio.Protocol):
+    # ClientChannel 이 쓰는 QTcpSocket 의 write/bytesToWrite 를 asyncio transport 로 제공한다
+    def __init__(self, server):
+        self._server = server
+        self._transport = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+        # transport 버퍼가 low water 아래로 내려가면 resume_writing 에서 queue 를 다시 보낸다
+        transport.set_write_buffer_limits(high=ClientChannel.SOCKET_HIGH_WATER)
+        peer = transport.get_extra_info('peername')
+        self._server._add_client(self, f'{peer[0]}:{peer[1]}' if peer else '')
+
+    def data_received(self, data):
+        self._server.receive_data(self, data)
+
+    def connection_lost(self, exc):
+        self._server._remove_client(self)
+
+    def pause_writing(self):
+        pass
+
+    def resume_writing(self):
+        self._server._pump(self)
+
+    def bytesToWrite(self):
+        return self._transport.get_write_buffer_size()
+
+    def write(self, data):
+        self._transport.write(data)
+
+    def abort(self):
+        self._transport.abort()
+
+
+class AsyncSocketServer(ServerCore):
+    # Qt 없이 하나의 asyncio loop 에서 client 를 처리하는 서버
+    instance = None
+
+    def __init__(self):
+        super().__init__(startFrameTimer=self._startTimer, stopFrameTimer=self._stopTimer, sendReply=self._postReply)
+        self._server = None
+        self._loop = None
+        self._loopThread = None
+        self._frameTask = None
+        self.closed = None
+
+        TelemetryAggregator.getInstance().setSinks(self.send_frame, self._immediate)
+
+    @classmethod
+    def getInstance(cls):
+        if cls.instance is None:
+            cls.instance = AsyncSocketServer()
+        return cls.instance
+
+    def close(self):
+        super().close()
+        if self._server is not None:
+            self._server.close()
+
+    async def start_server(self, host=None, port=ServerCore.PORT):
+        self._loop = asyncio.get_running_loop()
+        self._loopThread = threading.get_ident()
+        self.closed = asyncio.Event()
+        self._server = await self._loop.create_server(lambda: _Connection(self), host, port)
+        logger.debug(f"Server started on port {port}")
+        self.setTelemetryRate(TelemetryAggregator.getInstance().rate)
+
+    def _immediate(self, msgType, value):
+        # shard 를 쓰면 다른 스레드에서 publish 되므로 그때만 loop 로 넘긴다
+        if threading.get_ident() == self._loopThread:
+            self.send_message(msgType, value)
+        elif self._loop is not None:
+            self._loop.call_soon_threadsafe(self.send_message, msgType, value)
+
+    def _postReply(self, client_socket, func, result, error=None):
+        if threading.get_ident() == self._loopThread:
+            self._sendReply(client_socket, func, result, error)
+        elif self._loop is not None:
+            self._loop.call_soon_threadsafe(self._sendReply, client_socket, func, result, error)
+
+    def _startTimer(self, interval):
+        self._stopTimer()
+        self._frameTask = asyncio.ensure_future(self._flushLoop(interval))
+
+    def _stopTimer(self):
+        if self._frameTask is not None:
+            self._frameTask.cancel()
+            self._frameTask = None
+
+    async def _flushLoop(self, interval):
+        aggregator = TelemetryAggregator.getInstance()
+        while True:
+            await asyncio.sleep(interval)
+            aggregator.flush()
+
+    def _serverClosed(self):
+        self.closed.set()
@@ -1,8 +1,9 @@
 import logging
 from PyQt5.QtCore import QThread, pyqtSignal, pyqtSlot
 import asyncio
-import queue
-import time
+
+from commandBridge import CommandBridge
+from serverPool import ServerPool
 
 logger = logging.getLogger()
 
@@ -14,8 +15,7 @@ class AsyncThread(QThread):
     def __init__(self):
         super().__init__()
 
-        self._queue = queue.Queue()
-        self._timeStamp = time.time()
+        self._bridge = CommandBridge()
 
     @classmethod
     def getInstance(cls):
@@ -23,44 +23,28 @@ class AsyncThread(QThread):
             cls.instance = AsyncThread()
         return cls.instance
 
-    def put(self, item):
-        self._queue.put(item)
+    def put(self, item, lane=None, coalesce=None):
+        self._bridge.put(item, lane, coalesce)
+
+    def call(self, func, timeout=CommandBridge.CALL_TIMEOUT):
+        return self._bridge.call(func, timeout)
+
+    def closeLane(self, lane):
+        self._bridge.closeLane(lane)
+
+    def stats(self):
+        return self._bridge.stats()
 
     def putFinishMsg(self):
         logger.debug('')
-        self._queue.put('finish')
+        self._bridge.put('finish')
 
     async def main(self):
-        while True:
-            currentTime = time.time()
-            # logger.debug(f'curr: {currentTime}')
-            # logger.debug(f'prev: {self._timeStamp}')
-            if currentTime - self._timeStamp > 3:
-                self._timeStamp = time.time()
-                # logger.debug('.')
-
-            try:
-                data = self._queue.get(block=False)
-            except queue.Empty:
-                # logger.debug('queue.Empty')
-                await asyncio.sleep(0.01)
-                continue
-
-            logger.debug(f'data: {data}')
-            if data is None:
-                break
-            if data == 'finish':
-                logger.debug('finish')
-                break
-            method, args = data
-            logger.debug(f'method: {method}')
-            logger.debug(f'args: {args}')
-            # try:
-            await method(*args)
-            # except TypeError as e:
-            #     logger.debug(f'error: {e}')
+        await self._bridge.run()
+        # 드론 cleanup 이 끝난 뒤 남은 mavsdk_server 를 모두 종료한다
+        await ServerPool.getInstance().close()
 
     def run(self):
         asyncio.run(self.main())
 
-        self.quit()
\ No newline at end of file
+        self.quit()
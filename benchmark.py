@@ -0,0 +1,1104 @@
+import argparse
+import asyncio
+import csv
+import json
+import math
+import os
+import queue
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from commandBridge import CommandBridge
+from messageFraming import FrameBuffer, LengthPrefixedFrameBuffer
+from commandRegistry import CommandRegistry, DRONE_INDEX
+from wireProtocol import JsonCodec, BinaryCodec, DeltaCodec, DeltaDecoder
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def _printLatency(name, latencies):
+    ms = [v * 1000 for v in latencies]
+    print(f'{name:>10}: n={len(ms)} mean={statistics.mean(ms):.3f}ms p50={_percentile(ms, 50):.3f}ms '
+          f'p90={_percentile(ms, 90):.3f}ms p99={_percentile(ms, 99):.3f}ms max={max(ms):.3f}ms')
+
+
+class _PollingBridge:
+    # 기존 AsyncThread.main 의 10 ms polling 루프
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, item):
+        self._queue.put(item)
+
+    async def run(self):
+        while True:
+            try:
+                data = self._queue.get(block=False)
+            except queue.Empty:
+                await asyncio.sleep(0.01)
+                continue
+            if data == 'finish':
+                break
+            method, args = data
+            await method(*args)
+
+
+def _runBridge(bridge, count, interval, idle):
+    latencies = list()
+    cpu = dict()
+
+    async def record(sent):
+        latencies.append(time.perf_counter() - sent)
+
+    async def consumer():
+        await bridge.run()
+
+    def thread_main():
+        start = time.thread_time()
+        asyncio.run(consumer())
+        cpu['total'] = time.thread_time() - start
+
+    thread = threading.Thread(target=thread_main)
+    thread.start()
+
+    time.sleep(idle)
+    for _ in range(count):
+        time.sleep(random.uniform(0, 2 * interval))
+        bridge.put((record, (time.perf_counter(),)))
+    time.sleep(0.05)
+    bridge.put('finish')
+    thread.join()
+
+    return latencies, cpu['total']
+
+
+def benchBridge(args):
+    for name, bridge in (('polling', _PollingBridge()), ('event', CommandBridge())):
+        latencies, cpu = _runBridge(bridge, args.count, args.interval, args.idle)
+        _printLatency(name, latencies)
+        print(f'{"":>10}  consumer cpu={cpu * 1000:.1f}ms (incl. {args.idle:.1f}s idle)')
+
+
+def _sampleCommands(count):
+    messages = list()
+    for i in range(count):
+        messages.append(json.dumps({'func': 'setVelocityBody',
+                                    'args': [i % 4, random.uniform(-5, 5), random.uniform(-5, 5), 0.0, 0.0]}) + '\n')
+    return ''.join(messages).encode()
+
+
+def _chunks(stream, size):
+    return [stream[i:i + size] for i in range(0, len(stream), size)]
+
+
+def benchFraming(args):
+    stream = _sampleCommands(args.count)
+    cases = (('batched', _chunks(stream, args.batch)),
+             ('fragmented', _chunks(stream, args.fragment)))
+
+    for name, chunks in cases:
+        for decode in (False, True):
+            buffer = FrameBuffer()
+            received = 0
+            start = time.perf_counter()
+            for chunk in chunks:
+                frames = buffer.feed(chunk)
+                received += len(frames)
+                if decode:
+                    for frame in frames:
+                        json.loads(frame)
+            elapsed = time.perf_counter() - start
+            assert received == args.count
+            label = f'{name}+json' if decode else name
+            print(f'{label:>16}: {len(chunks)} reads, {received / elapsed:,.0f} msg/s')
+
+
+def _sampleTelemetry(count):
+    samples = list()
+    for i in range(count):
+        samples.append(('position', (i % 50, 37.5 + random.random() * 1e-3, 127.0 + random.random() * 1e-3,
+                                     random.uniform(0, 100))))
+        samples.append(('heading', (i % 50, random.uniform(0, 360))))
+    return samples
+
+
+def benchCodec(args):
+    registry = CommandRegistry()
+    registry.setDroneCount(lambda: 256)
+    registry.register('setVelocityBody', None, (DRONE_INDEX, float, float, float, float))
+    jsonCodec = JsonCodec()
+    binaryCodec = BinaryCodec(registry)
+
+    telemetry = _sampleTelemetry(args.count)
+    commands = [('setVelocityBody', [i % 50, random.uniform(-5, 5), random.uniform(-5, 5), 0.0, 0.0])
+                for i in range(args.count)]
+
+    def run(label, encode, decode, items):
+        start = time.perf_counter()
+        encoded = [encode(*item) for item in items]
+        encodeTime = time.perf_counter() - start
+        start = time.perf_counter()
+        for frame in encoded:
+            decode(frame)
+        decodeTime = time.perf_counter() - start
+        size = sum(len(frame) for frame in encoded)
+        print(f'{label:>18}: encode {len(items) / encodeTime:>12,.0f} msg/s, decode {len(items) / decodeTime:>12,.0f} msg/s, '
+              f'{size / len(items):6.1f} B/msg')
+
+    run('json telemetry', jsonCodec.encode, json.loads, telemetry)
+    run('binary telemetry', binaryCodec.encode, lambda frame: binaryCodec.decodeTelemetry(frame[LengthPrefixedFrameBuffer.HEADER.size:]), telemetry)
+    run('json command', lambda func, a: (json.dumps({'func': func, 'args': a}) + '\n').encode(),
+        jsonCodec.decode, commands)
+    run('binary command', binaryCodec.encodeCommand, lambda frame: binaryCodec.decode(frame[LengthPrefixedFrameBuffer.HEADER.size:]), commands)
+
+
+def _scalarFollowerPosition(leader_latitude, leader_longitude, leader_heading, distance, relative_angle):
+    # 기존 SwarmManager._calculateFollowerPosition (haversine.inverse_haversine) 과 같은 계산
+    lat = math.radians(leader_latitude)
+    lon = math.radians(leader_longitude)
+    bearing = math.radians(leader_heading) + math.radians(relative_angle)
+    d = distance / 6371008.8
+    follower_lat = math.asin(math.sin(lat) * math.cos(d) + math.cos(lat) * math.sin(d) * math.cos(bearing))
+    follower_lon = lon + math.atan2(math.sin(bearing) * math.sin(d) * math.cos(lat),
+                                    math.cos(d) - math.sin(lat) * math.sin(follower_lat))
+    return math.degrees(follower_lat), math.degrees(follower_lon)
+
+
+def benchFormation(args):
+    from formationSolver import FormationSolver
+
+    for count in args.followers:
+        offsets = [(random.uniform(5, 50), random.uniform(0, 360)) for _ in range(count)]
+        solver = FormationSolver(offsets)
+
+        start = time.perf_counter()
+        for _ in range(args.ticks):
+            for distance, angle in offsets:
+                _scalarFollowerPosition(37.5, 127.0, 45.0, distance, angle)
+        scalar = (time.perf_counter() - start) / args.ticks
+
+        start = time.perf_counter()
+        for _ in range(args.ticks):
+            lats, lons = solver.solve(37.5, 127.0, 45.0)
+            lats.tolist(), lons.tolist()
+        vectorized = (time.perf_counter() - start) / args.ticks
+
+        expected = [_scalarFollowerPosition(37.5, 127.0, 45.0, d, a) for d, a in offsets]
+        error = max(max(abs(lat - e[0]), abs(lon - e[1])) for lat, lon, e in zip(lats, lons, expected))
+        print(f'{count:>5} followers: loop {scalar * 1e6:9.1f}us/tick, vectorized {vectorized * 1e6:9.1f}us/tick, '
+              f'max error {error:.2e} deg')
+
+
+class _SyntheticDrone:
+    # shard benchmark 용 가짜 드론. connect 하면 mavsdk telemetry 대신 샘플을 최대한 빠르게 만들어 낸다
+    def __init__(self, index):
+        from droneState import DroneState
+        self.index = index
+        self.isConnected = False
+        self.systemId = index + 1
+        self.state = DroneState.empty()
+        self.version = 0
+        self._task = None
+
+    def snapshot(self):
+        return {'index': self.index, 'version': self.version, 'connected': self.isConnected, 'systemId': self.systemId}
+
+    async def connect(self, addr):
+        self.isConnected = True
+        self._task = asyncio.ensure_future(self._telemetry())
+
+    async def cleanup(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _telemetry(self):
+        from telemetryAggregator import TelemetryAggregator
+        count = 0
+        while True:
+            count += 1
+            # gRPC 메시지 decode 비용 대신
+            sample = json.loads(json.dumps({'latitude_deg': 37.5 + count * 1e-7, 'longitude_deg': 127.0,
+                                            'relative_altitude_m': 10.0, 'absolute_altitude_m': 50.0}))
+            self.state = self.state._replace(latitude=sample['latitude_deg'], longitude=sample['longitude_deg'],
+                                             altitude=float(count), position_timestamp=time.monotonic())
+            TelemetryAggregator.getInstance().publish('position', (self.index, sample['latitude_deg'],
+                                                                   sample['longitude_deg'], 10.0))
+            await asyncio.sleep(0)
+
+
+def benchShard(args):
+    from droneShard import ShardPool
+
+    async def run(pool):
+        drones = [pool.createDrone(index) for index in range(args.drones)]
+        await asyncio.gather(*[drone.connect('udp://:14540') for drone in drones])
+        await asyncio.sleep(args.warmup)
+        before = sum(drone.state.altitude for drone in drones)
+        await asyncio.sleep(args.duration)
+        after = sum(drone.state.altitude for drone in drones)
+        await asyncio.gather(*[drone.cleanup() for drone in drones])
+        return (after - before) / args.duration
+
+    for shards in args.shards:
+        pool = ShardPool(shards, factory='benchmark:_SyntheticDrone')
+        pool.start()
+        try:
+            rate = asyncio.run(run(pool))
+        finally:
+            pool.stop()
+        print(f'{shards:>3} shards, {args.drones} drones: {rate:>12,.0f} samples/s')
+
+
+def _rssKb(pid):
+    # Linux 전용. 다른 OS 에서는 0
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _serviceRoundTrips(proc, port, count, timeout):
+    started = time.perf_counter()
+    while True:
+        if proc.poll() is not None:
+            raise RuntimeError(f'service exited with {proc.returncode}')
+        try:
+            sock = socket.create_connection(('127.0.0.1', port), timeout=timeout)
+            break
+        except OSError:
+            if time.perf_counter() - started > timeout:
+                raise
+            time.sleep(0.005)
+    reader = sock.makefile('rb')
+
+    def call(func, args=()):
+        sock.sendall((json.dumps({'func': func, 'args': list(args)}) + '\n').encode())
+        return json.loads(reader.readline())
+
+    call('getDrones')
+    startup = time.perf_counter() - started
+
+    latencies = list()
+    for _ in range(count):
+        sent = time.perf_counter()
+        call('getDrones')
+        latencies.append(time.perf_counter() - sent)
+
+    # readyToFollow 는 기본 swarm 의 lane 에서 실행되므로 lane 대기 시간이 명령 전달 지연이 된다
+    # 앞 명령 뒤에 줄 서는 시간이 섞이지 않도록 간격을 두고 보낸다
+    for _ in range(count):
+        sock.sendall(b'{"func": "readyToFollow", "args": []}\n')
+        time.sleep(0.002)
+    laneWait = 0.0
+    while True:
+        lane = call('getLaneStats')['value']['result'].get(CommandBridge.swarmLane(0), {})
+        if lane.get('processed', 0) >= count:
+            laneWait = lane['waitAvg']
+            break
+        time.sleep(0.01)
+
+    rss = _rssKb(proc.pid)
+    sock.close()
+    return startup, rss, latencies, laneWait
+
+
+def benchMode(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    modes = {'qt': [sys.executable, os.path.join(here, 'main.py')],
+             'headless': [sys.executable, os.path.join(here, 'headless.py'), '--port', '12345']}
+
+    for name in args.modes:
+        proc = subprocess.Popen(modes[name], cwd=here, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            startup, rss, latencies, laneWait = _serviceRoundTrips(proc, 12345, args.count, args.timeout)
+        finally:
+            proc.kill()
+            proc.wait()
+        print(f'{name}: startup={startup * 1000:.0f}ms rss={rss / 1024:.1f}MiB laneWait={laneWait * 1000:.3f}ms')
+        _printLatency('roundTrip', latencies)
+
+
+class _SimClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+def benchFilter(args):
+    import types
+    from collections import namedtuple
+    import droneCore
+    import telemetryFilter
+    from telemetryAggregator import TelemetryAggregator
+    from telemetryFilter import TelemetryFilter
+
+    # 제자리 비행: 위치는 cm 단위, 헤딩은 0.1 도 단위로 흔들리고 armed / flightMode 는 같은 값이 반복된다
+    Position = namedtuple('Position', 'latitude_deg longitude_deg relative_altitude_m absolute_altitude_m')
+    Heading = namedtuple('Heading', 'heading_deg')
+    Velocity = namedtuple('Velocity', 'north_m_s east_m_s down_m_s')
+    FlightMode = namedtuple('FlightMode', 'name')
+    rng = random.Random(1)
+    streams = {'position': lambda i: Position(37.5 + rng.gauss(0, 1e-7), 127.0 + rng.gauss(0, 1e-7),
+                                              10.0 + rng.gauss(0, 0.02), 60.0),
+               'heading': lambda i: Heading(90.0 + rng.gauss(0, 0.1)),
+               'velocity_ned': lambda i: Velocity(rng.gauss(0, 0.01), rng.gauss(0, 0.01), rng.gauss(0, 0.01)),
+               'armed': lambda i: True,
+               'flight_mode': lambda i: FlightMode('OFFBOARD')}
+    count = int(args.duration * args.rate)
+
+    clock = _SimClock()
+    droneCore.time = types.SimpleNamespace(monotonic=clock.monotonic)
+    telemetryFilter.time = types.SimpleNamespace(monotonic=clock.monotonic)
+    aggregator = TelemetryAggregator.getInstance()
+    codec = JsonCodec()
+
+    def run(enabled):
+        sent = {'messages': 0, 'bytes': 0}
+
+        def frameSink(items):
+            sent['messages'] += 1
+            sent['bytes'] += len(codec.encodeFrame(items))
+
+        def immediateSink(msgType, value):
+            sent['messages'] += 1
+            sent['bytes'] += len(codec.encode(msgType, value))
+
+        aggregator.setSinks(frameSink, immediateSink)
+        TelemetryFilter.instance = None
+        TelemetryFilter.getInstance().enabled = enabled
+
+        def stream(make):
+            async def generate():
+                nextFlush = 0.0
+                for i in range(count):
+                    clock.now = i / args.rate
+                    if clock.now >= nextFlush:
+                        aggregator.flush()
+                        nextFlush += 1 / aggregator.rate
+                    yield make(i)
+                aggregator.flush()
+            return generate
+
+        drone = droneCore.DroneCore()
+        drone._drone = types.SimpleNamespace(telemetry=types.SimpleNamespace(
+            **{name: stream(make) for name, make in streams.items()}))
+
+        async def main():
+            await drone._position()
+            await drone._heading_coroutine()
+            await drone._velocity_coroutine()
+            await drone._armed()
+            await drone._flight_mode()
+
+        started = time.process_time()
+        asyncio.run(main())
+        cpu = time.process_time() - started
+        print(f'filter {"on " if enabled else "off"}: messages={sent["messages"]:>6} bytes={sent["bytes"]:>9,} '
+              f'cpu/sample={cpu / (count * len(streams)) * 1e6:.2f}us')
+        return sent['bytes']
+
+    off = run(False)
+    on = run(True)
+    print(f'{args.duration:.0f}s hover at {args.rate:.0f} Hz per stream: outbound bytes {on / off:.1%} of unfiltered')
+
+
+def _loadFlightLog(path):
+    # csv 열: time, index, latitude, longitude, altitude, heading (time 은 초)
+    samples = list()
+    with open(path, newline='') as log:
+        for row in csv.DictReader(log):
+            samples.append((float(row['time']), int(row['index']), float(row['latitude']), float(row['longitude']),
+                            float(row['altitude']), float(row['heading'])))
+    samples.sort()
+    return samples
+
+
+def _syntheticFlight(drones, duration, rate):
+    # 로그가 없을 때: 5 m/s 로 원을 그리는 편대 비행 + GPS 잡음
+    rng = random.Random(1)
+    samples = list()
+    for step in range(int(duration * rate)):
+        t = step / rate
+        for index in range(drones):
+            angle = t * 5.0 / 50.0 + index * 0.3
+            north = 50.0 * math.cos(angle) + rng.gauss(0, 0.02)
+            east = 50.0 * math.sin(angle) + rng.gauss(0, 0.02)
+            samples.append((t, index, 37.5 + math.degrees(north / 6371008.8),
+                            127.0 + math.degrees(east / (6371008.8 * math.cos(math.radians(37.5)))),
+                            20.0 + index + rng.gauss(0, 0.05), (math.degrees(angle) + 90.0) % 360.0))
+    return samples
+
+
+def benchStream(args):
+    samples = _loadFlightLog(args.log) if args.log else _syntheticFlight(args.drones, args.duration, args.rate)
+    duration = samples[-1][0] - samples[0][0] or 1.0
+
+    # 서버와 같이 frame 주기마다 드론별 최신 값만 모은다
+    frames = list()
+    latest = dict()
+    nextFrame = samples[0][0]
+    for t, index, lat, lon, alt, heading in samples:
+        if t >= nextFrame:
+            if latest:
+                frames.append([[msgType, value] for (msgType, _), value in latest.items()])
+                latest = dict()
+            while nextFrame <= t:
+                nextFrame += 1 / args.frameRate
+        latest[('position', index)] = [index, lat, lon, alt]
+        latest[('heading', index)] = [index, heading]
+    if latest:
+        frames.append([[msgType, value] for (msgType, _), value in latest.items()])
+
+    registry = CommandRegistry()
+    for name, encode in (('json', JsonCodec().encodeFrame), ('binary', BinaryCodec(registry).encodeFrame)):
+        started = time.process_time()
+        size = sum(len(encode(items)) for items in frames)
+        cpu = time.process_time() - started
+        print(f'{name:>8}: {size / duration:>10,.0f} B/s  encode {cpu / len(frames) * 1e6:8.1f} us/frame')
+
+    codec = DeltaCodec(registry)
+    stream = codec.newStream()
+    decoder = DeltaDecoder(codec)
+    rng = random.Random(2)
+    size = 0
+    encodeCpu = 0.0
+    maxError = 0.0
+    pendingAcks = list()
+    truth = dict()
+    for items in frames:
+        started = time.process_time()
+        message = stream.encodeFrame(items)
+        encodeCpu += time.process_time() - started
+        for msgType, value in items:
+            truth[(msgType, value[0])] = value[1:]
+        if message is None:
+            continue
+        size += len(message)
+        if rng.random() < args.loss:
+            continue
+
+        seq, decoded = decoder.decode(message[LengthPrefixedFrameBuffer.HEADER.size:])
+        for msgType, value in decoded:
+            if msgType == 'position':
+                expected = truth[(msgType, value[0])]
+                maxError = max(maxError, abs(value[1] - expected[0]), abs(value[2] - expected[1]))
+        # ack 는 링크 왕복 시간만큼 늦게 도착한다
+        pendingAcks.append(seq)
+        if len(pendingAcks) > args.ackLag:
+            stream.ack(pendingAcks.pop(0))
+
+    stats = stream.stats()
+    print(f'{"delta":>8}: {size / duration:>10,.0f} B/s  encode {encodeCpu / len(frames) * 1e6:8.1f} us/frame  '
+          f'keyframes={stats["keyframes"]} deltas={stats["deltas"]} maxLatLonError={maxError:.1e}deg')
+
+
+_STAND_IN_SERVER = """
+import socket, sys, time
+time.sleep(float(sys.argv[2]))
+server = socket.socket()
+server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+server.bind(('127.0.0.1', int(sys.argv[1])))
+server.listen(64)
+while True:
+    server.accept()[0].close()
+"""
+
+
+def _standInServer(startDelay, ports=None):
+    # mavsdk_server 대신 띄우는 프로세스. startDelay 동안 spawn 과 gRPC 준비를 흉내 낸 뒤 포트를 연다
+    def command(address, port):
+        if ports is not None:
+            ports.append(port)
+        return [sys.executable, '-c', _STAND_IN_SERVER, str(port), str(startDelay)]
+    return command
+
+
+def _portOpen(port):
+    try:
+        socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+        return True
+    except OSError:
+        return False
+
+
+class _FakeSystem:
+    # mavsdk System 대신. 연결 주소별로 link 와 health 가 잡히기까지의 시간, link 끊김, 처음 몇 번의 연결 실패를 흉내 낸다
+    def __init__(self, profiles, systems):
+        from types import SimpleNamespace
+        self._profiles = profiles
+        self._systems = systems
+        self._linkDelay = 0.0
+        self._healthDelay = 0.0
+        self._linkAt = None
+        self._downUntil = 0.0
+        self.core = SimpleNamespace(connection_state=self._connectionState)
+        self.param = SimpleNamespace(get_param_int=self._getParamInt)
+        idle = self._idle
+        self.telemetry = SimpleNamespace(health=self._health, status_text=idle, armed=idle, flight_mode=idle,
+                                         position=idle, heading=idle, velocity_ned=idle)
+
+    async def connect(self, system_address=None):
+        profile = self._profiles[system_address]
+        self._systems[system_address] = self
+        self._linkDelay, self._healthDelay = profile[0], profile[1]
+        if profile[2]:
+            # mavsdk_server 가 응답하지 않는 경우
+            profile[2] -= 1
+            await asyncio.Event().wait()
+        self._linkAt = time.monotonic() + self._linkDelay
+
+    def dropLink(self, duration):
+        self._downUntil = time.monotonic() + duration
+
+    def _linked(self):
+        now = time.monotonic()
+        return self._linkAt is not None and now >= self._linkAt and now >= self._downUntil
+
+    async def _connectionState(self):
+        from types import SimpleNamespace
+        last = None
+        while True:
+            linked = self._linked()
+            if linked != last:
+                last = linked
+                yield SimpleNamespace(is_connected=linked)
+            await asyncio.sleep(0.005)
+
+    async def _health(self):
+        from types import SimpleNamespace
+        while True:
+            ok = self._linked() and time.monotonic() >= self._linkAt + self._healthDelay
+            yield SimpleNamespace(is_global_position_ok=ok, is_home_position_ok=ok)
+            await asyncio.sleep(0.01)
+
+    async def _getParamInt(self, name):
+        return 1
+
+    async def _idle(self):
+        await asyncio.Event().wait()
+        yield
+
+
+def benchConnect(args):
+    import droneCore
+    from droneCore import DroneCore
+    from serverPool import ServerPool
+    from telemetryAggregator import TelemetryAggregator
+
+    rng = random.Random(3)
+    delays = [(rng.uniform(*args.linkDelay), rng.uniform(*args.healthDelay)) for _ in range(args.drones)]
+    addresses = [f'udp://:{14540 + index}' for index in range(args.drones)]
+    systems = dict()
+
+    def profiles():
+        # 매 단계마다 드론 0 의 연결 실패 횟수를 다시 채운다
+        return {address: [link, health, args.failures if index == 0 else 0]
+                for index, (address, (link, health)) in enumerate(zip(addresses, delays))}
+
+    DroneCore.CONNECT_TIMEOUT = args.connectTimeout
+    DroneCore.RECONNECT_DELAY = args.reconnectDelay
+    TelemetryAggregator.getInstance().rate = 0
+
+    def setUp():
+        phaseProfiles = profiles()
+        droneCore.System = lambda **kwargs: _FakeSystem(phaseProfiles, systems)
+        ServerPool.instance = ServerPool(_standInServer(args.serverStart))
+        return [DroneCore(index=index) for index in range(args.drones)]
+
+    async def tearDown(drones):
+        await asyncio.gather(*[drone.cleanup() for drone in drones])
+        await ServerPool.getInstance().close()
+
+    async def waitReady(drones):
+        while any(drone.connectionState != DroneCore.READY for drone in drones):
+            await asyncio.sleep(0.005)
+
+    async def serial():
+        # 기존 AsyncThread 한 줄 queue 처럼 드론마다 준비될 때까지 기다린 뒤 다음 드론을 연결한다
+        drones = setUp()
+        started = time.monotonic()
+        for drone, address in zip(drones, addresses):
+            await drone.connect(address)
+            await waitReady([drone])
+        elapsed = time.monotonic() - started
+        await tearDown(drones)
+        return elapsed
+
+    async def parallel():
+        drones = setUp()
+        events = list()
+        TelemetryAggregator.getInstance().setSinks(
+            None, lambda msgType, value: events.append((time.monotonic(), msgType, value)))
+        started = time.monotonic()
+        await asyncio.gather(*[drone.connect(address) for drone, address in zip(drones, addresses)])
+        await waitReady(drones)
+        elapsed = time.monotonic() - started
+
+        # 드론 0 의 link 를 잠시 끊어서 LOST -> RECONNECTING -> READY 를 확인한다
+        dropped = time.monotonic()
+        systems[addresses[0]].dropLink(args.dropFor)
+        await asyncio.sleep(0.05)
+        await waitReady(drones[:1])
+        recovered = time.monotonic() - dropped
+        await tearDown(drones)
+
+        transitions = [f'{t - started:.2f}s:{value[1]}' for t, msgType, value in events
+                       if msgType == 'connectionState' and value[0] == 0]
+        return elapsed, recovered, transitions
+
+    slowest = max(link + health for link, health in delays)
+    print(f'{args.drones} drones, slowest single drone link+health: {slowest:.2f}s, '
+          f'server start: {args.serverStart:.2f}s')
+    print(f'  serial bring-up  : {asyncio.run(serial()):.2f}s')
+    elapsed, recovered, transitions = asyncio.run(parallel())
+    print(f'  parallel bring-up: {elapsed:.2f}s')
+    print(f'  drone 0 link drop {args.dropFor:.1f}s -> ready again after {recovered:.2f}s')
+    print(f'  drone 0 states: {" ".join(transitions)}')
+
+
+def benchPool(args):
+    from serverPool import ServerPool
+
+    addresses = [f'udp://:{14540 + index}' for index in range(args.drones)]
+    ports = list()
+
+    async def timed(coro):
+        started = time.monotonic()
+        result = await coro
+        return result, time.monotonic() - started
+
+    async def connect(pool, address):
+        # System.connect 처럼 gRPC 포트가 열릴 때까지 기다린다
+        backend = await pool.checkout(address)
+        await pool.waitReady(backend, 5.0)
+        return backend
+
+    async def run():
+        pool = ServerPool(_standInServer(args.serverStart, ports), maxServers=args.maxServers,
+                          idleTimeout=args.idleTimeout)
+
+        # pool 이 없던 때처럼 connect 마다 server 를 새로 띄우는 경우
+        cold = list()
+        for _ in range(args.cycles):
+            for address in addresses:
+                backend, elapsed = await timed(connect(pool, address))
+                cold.append(elapsed)
+                await pool.release(backend, healthy=False)
+
+        # 미리 띄워 둔 server 를 connect / disconnect 마다 빌리고 돌려주는 경우
+        for address in addresses:
+            await pool.warm(address)
+        await asyncio.sleep(args.serverStart + 0.5)
+        warm = list()
+        for _ in range(args.cycles):
+            for address in addresses:
+                backend, elapsed = await timed(connect(pool, address))
+                warm.append(elapsed)
+                await pool.release(backend)
+        print(f'{args.drones} addresses x {args.cycles} connect/disconnect cycles, '
+              f'server start {args.serverStart:.2f}s')
+        _printLatency('spawn', cold)
+        _printLatency('pooled', warm)
+
+        # 죽은 server 는 health check 에서 걸러서 새로 띄운다
+        victim = pool._idle[addresses[0]][0]
+        victim.process.kill()
+        victim.process.wait()
+        backend = await connect(pool, addresses[0])
+        print(f'  crashed idle server replaced: {backend is not victim and backend.alive}')
+        assert backend is not victim and backend.alive and backend.ready
+        await pool.release(backend)
+
+        # 최대 개수를 넘기면 가장 오래 쉬고 있던 server 부터 종료한다
+        extra = [f'udp://:{15540 + index}' for index in range(args.extra)]
+        before, evicted = len(pool), pool.evicted
+        for address in extra:
+            await pool.release(await pool.checkout(address))
+            assert len(pool) <= pool.maxServers
+        print(f'  after {len(extra)} more addresses: {len(pool)} servers (max {pool.maxServers}), '
+              f'evicted {pool.evicted}')
+        assert pool.evicted - evicted == max(0, before + len(extra) - pool.maxServers)
+        assert all(pool._idle.get(address) for address in extra)
+
+        await asyncio.sleep(args.idleTimeout * 1.5)
+        print(f'  after {args.idleTimeout * 1.5:.1f}s idle: {len(pool)} servers, evicted {pool.evicted}')
+        assert len(pool) == 0
+
+        # 주소 하나에는 server 하나만 띄운다
+        await pool.warm(addresses[1])
+        started = await pool.warm(addresses[1])
+        print(f'  warm an address that already has a server: started {started}')
+        assert not started
+        busy = await pool.checkout(addresses[0])
+        _, closeTime = await timed(pool.close())
+        leaked = [port for port in ports if _portOpen(port)]
+        print(f'  close with 1 busy + 1 idle: {closeTime * 1000:.1f}ms, servers left listening: {len(leaked)}'
+              f' of {len(ports)} spawned, busy server alive: {busy.alive}')
+        print(f'  stats: {pool.stats()}')
+        assert not leaked and not busy.alive and len(pool) == 0
+
+        # _freePort 로 받은 포트를 다른 프로세스가 먼저 가져가면 server 가 바로 끝나고, 새 포트로 다시 띄운다
+        import serverPool
+        taken = socket.socket()
+        taken.bind(('127.0.0.1', 0))
+        taken.listen(1)
+        freePort = serverPool._freePort
+        offered = [taken.getsockname()[1]]
+        serverPool._freePort = lambda: offered.pop() if offered else freePort()
+        pool = ServerPool(_standInServer(0.0, ports))
+        try:
+            backend = await connect(pool, addresses[0])
+        finally:
+            serverPool._freePort = freePort
+            taken.close()
+        print(f'  port taken before bind: spawned {pool.spawned}, '
+              f'server on port {backend.port} ready: {backend.ready}')
+        assert pool.spawned == 2 and backend.ready
+        await pool.close()
+        assert not [port for port in ports if _portOpen(port)]
+
+    asyncio.run(run())
+
+
+class _FakeFollower:
+    # swarm 준비 benchmark 용. arm / offboard 시작에 걸리는 시간과 실패를 흉내 낸다
+    def __init__(self, index, rng, failureRate):
+        self.index = index
+        self._armDelay = rng.uniform(0.05, 0.2)
+        self._offboardDelay = rng.uniform(0.05, 0.2)
+        self._fails = rng.random() < failureRate
+
+    async def arm(self):
+        await asyncio.sleep(self._armDelay)
+        return not self._fails
+
+    async def start_offboard_mode(self):
+        await asyncio.sleep(self._offboardDelay)
+        return True
+
+    async def stop_offboard_mode(self):
+        return True
+
+    async def disarm(self):
+        return True
+
+
+def benchReady(args):
+    from swarmManager import Swarm
+
+    async def serial(drones):
+        # 기존 readyToFollow: 한 대씩 arm, 0.1 초, offboard
+        for drone in drones:
+            await drone.arm()
+            await asyncio.sleep(0.1)
+            await drone.start_offboard_mode()
+
+    async def run(count):
+        rng = random.Random(count)
+        drones = [_FakeFollower(index, rng, args.failureRate) for index in range(1, count + 1)]
+        started = time.monotonic()
+        await serial(drones)
+        serialTime = time.monotonic() - started
+
+        swarm = Swarm()
+        swarm.setLeader(_FakeFollower(0, rng, 0.0))
+        for drone in drones:
+            swarm.addFollower(drone, 5.0, 0.0)
+        results = dict()
+        for barrier in Swarm.BARRIERS:
+            swarm.setReadyBarrier(barrier, args.quorum)
+            results[barrier] = await swarm.readyToFollow()
+        return serialTime, results
+
+    print(f'failure rate {args.failureRate:.0%}, quorum {args.quorum:.0%}, '
+          f'parallel prepare limit {Swarm.MAX_PARALLEL_PREPARE}')
+    for count in args.followers:
+        serialTime, results = asyncio.run(run(count))
+        parallel = ' '.join(f'{barrier}={result["elapsed"]:.2f}s/{"pass" if result["passed"] else "fail"}'
+                            for barrier, result in results.items())
+        failed = len(results[Swarm.BARRIER_ALL]['failed'])
+        print(f'{count:>4} followers ({failed} failing): serial {serialTime:6.2f}s  parallel {parallel}')
+
+
+class _FakeLeader:
+    # swarm benchmark 용 리더. state 는 항상 방금 받은 샘플이다
+    def __init__(self, index):
+        self.index = index
+
+    @property
+    def state(self):
+        from droneState import DroneState
+        now = time.monotonic()
+        return DroneState(37.5, 127.0, 10.0, 60.0, 45.0, 2.0, 1.0, 0.0, now, now, now)
+
+
+class _FakeSetpointFollower:
+    # swarm benchmark 용 팔로워. setpoint 응답까지 latency 만큼 걸린다
+    def __init__(self, index, latency):
+        self.index = index
+        self._latency = latency
+        self.requested = 0
+        self.sent = 0
+
+    async def set_position_global(self, lat, lon, alt, yaw):
+        # 응답 지연도 loop timer 하나를 쓴다
+        self.requested += 1
+        await asyncio.sleep(self._latency)
+        self.sent += 1
+
+
+def benchSwarms(args):
+    from swarmManager import Swarm, SwarmManager
+    from tickScheduler import TickScheduler
+
+    def frequency(swarmId):
+        # swarm 마다 주기를 다르게 해서 deadline 이 모이지 않는 경우도 본다
+        return args.rate * (1.0, 0.5, 2.0)[swarmId % 3] if args.mixed else args.rate
+
+    def build(swarm, swarmId):
+        index = swarmId * (args.followers + 1)
+        swarm.setLeader(_FakeLeader(index))
+        for i in range(args.followers):
+            swarm.addFollower(_FakeSetpointFollower(index + i + 1, args.latency), 10.0, 360.0 * i / args.followers)
+        return swarm.followerDrones()
+
+    def countTimers():
+        # 두 방식 모두 같은 단위로 센다: event loop 에 예약된 timer callback 수
+        loop = asyncio.get_running_loop()
+        timers = [0]
+        callAt = loop.call_at
+
+        def call_at(when, callback, *args, **kwargs):
+            timers[0] += 1
+            return callAt(when, callback, *args, **kwargs)
+        loop.call_at = call_at
+        return timers
+
+    async def shared(count):
+        timers = countTimers()
+        manager = SwarmManager.instance = SwarmManager()
+        swarmIds = [SwarmManager.DEFAULT_SWARM] + [manager.createSwarm() for _ in range(count - 1)]
+        followers = list()
+        for swarmId in swarmIds:
+            followers += build(manager.swarm(swarmId), swarmId)
+            manager.setFollowFrequency(swarmId, frequency(swarmId))
+            await manager.runTaskFollow(swarmId)
+        await asyncio.sleep(args.duration)
+        stats = [manager.followStats(swarmId) for swarmId in swarmIds]
+        for swarmId in swarmIds:
+            manager.stopFollow(swarmId)
+        return stats, timers[0], followers
+
+    async def perSwarm(count):
+        # 비교용: 기존처럼 swarm 마다 자기 TickScheduler task 를 돌린다
+        timers = countTimers()
+        swarms = [Swarm(swarmId) for swarmId in range(count)]
+        schedulers = [TickScheduler(frequency(swarmId)) for swarmId in range(count)]
+        followers = list()
+        for swarm in swarms:
+            followers += build(swarm, swarm.id)
+        tasks = [asyncio.ensure_future(scheduler.run(swarm.follow)) for swarm, scheduler in zip(swarms, schedulers)]
+        await asyncio.sleep(args.duration)
+        for task in tasks:
+            task.cancel()
+        return [scheduler.stats() for scheduler in schedulers], timers[0], followers
+
+    print(f'{args.followers} followers per swarm, {"mixed " if args.mixed else ""}{args.rate:.0f} Hz, '
+          f'send latency {args.latency * 1000:.0f}ms, {args.duration:.0f}s')
+    for count in args.swarms:
+        for name, run in (('shared scheduler', shared), ('task per swarm', perSwarm)):
+            started = time.process_time()
+            stats, timers, followers = asyncio.run(run(count))
+            cpu = (time.process_time() - started) / args.duration
+            ratio = [entry['achievedRate'] / entry['frequency'] for entry in stats]
+            # 팔로워의 응답 지연 timer 는 양쪽이 같으므로 빼고 scheduler 가 예약한 timer 만 비교한다
+            sends = sum(follower.requested for follower in followers)
+            print(f'{count:>4} swarms {count * args.followers:>6} followers {name:>16}: cpu {cpu:6.1%}  '
+                  f'achieved min {min(ratio):6.1%} of target, jitter max {max(e["jitterMax"] for e in stats) * 1000:6.1f}ms, '
+                  f'missed {sum(e["missedDeadlines"] for e in stats):>4}, loop timers {timers} '
+                  f'({timers - sends} besides {sends} setpoint sends)')
+
+
+class _FakeOffboard:
+    # setpoint pump benchmark 용 mavsdk offboard. 응답까지 latency 만큼 걸린다
+    def __init__(self, latency):
+        self._latency = latency
+
+    async def _set(self, setpoint):
+        await asyncio.sleep(self._latency)
+
+    set_velocity_body = _set
+    set_velocity_ned = _set
+    set_attitude = _set
+    set_position_ned = _set
+    set_position_global = _set
+
+
+def benchPump(args):
+    from types import SimpleNamespace
+    from droneCore import DroneCore
+    from setpointPump import SetpointPump
+    from tickScheduler import TickScheduler
+
+    def makeDrones(count):
+        drones = [DroneCore(index=index) for index in range(count)]
+        for drone in drones:
+            # 드론 0 은 응답이 주기의 세 배만큼 느린 드론
+            latency = 3 / args.rate if drone.index == 0 else args.latency
+            drone._drone = SimpleNamespace(offboard=_FakeOffboard(latency))
+        return drones
+
+    async def shared(count):
+        drones = makeDrones(count)
+        pump = SetpointPump.instance = SetpointPump(args.rate)
+        for drone in drones:
+            pump.add(drone)
+        await asyncio.sleep(args.duration)
+        stats = pump.stats()
+        for drone in drones:
+            pump.remove(drone)
+        return [entry['achievedRate'] for entry in stats['drones']]
+
+    async def perDrone(count):
+        # 비교용: 드론마다 자기 타이머로 보내고 응답을 기다린다
+        drones = makeDrones(count)
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(TickScheduler(args.rate).run(drone.resend_setpoint)) for drone in drones]
+        await asyncio.sleep(args.duration)
+        elapsed = time.monotonic() - started
+        for task in tasks:
+            task.cancel()
+        return [drone.setpointsSent / elapsed for drone in drones]
+
+    print(f'{args.rate:.0f} Hz for {args.duration:.0f}s, send latency {args.latency * 1000:.0f}ms, '
+          f'drone 0 latency {3000 / args.rate:.0f}ms')
+    for count in args.drones:
+        for name, run in (('shared pump', shared), ('task per drone', perDrone)):
+            started = time.process_time()
+            rates = asyncio.run(run(count))
+            cpu = (time.process_time() - started) / args.duration
+            others = rates[1:]
+            print(f'{count:>5} drones {name:>14}: cpu {cpu:6.1%}  achieved min {min(others):5.1f} '
+                  f'mean {statistics.mean(others):5.1f} Hz, slow drone {rates[0]:5.1f} Hz')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('bridge', help='AsyncThread put-to-execute latency')
+    p.add_argument('--count', type=int, default=500)
+    p.add_argument('--interval', type=float, default=0.005)
+    p.add_argument('--idle', type=float, default=1.0)
+    p.set_defaults(func=benchBridge)
+
+    p = sub.add_parser('framing', help='SocketServer framing parser throughput')
+    p.add_argument('--count', type=int, default=200000)
+    p.add_argument('--batch', type=int, default=65536)
+    p.add_argument('--fragment', type=int, default=7)
+    p.set_defaults(func=benchFraming)
+
+    p = sub.add_parser('codec', help='JSON vs binary wire protocol throughput and size')
+    p.add_argument('--count', type=int, default=100000)
+    p.set_defaults(func=benchCodec)
+
+    p = sub.add_parser('formation', help='SwarmManager formation solve time per tick')
+    p.add_argument('--followers', type=int, nargs='+', default=[3, 10, 50, 100, 200, 1000])
+    p.add_argument('--ticks', type=int, default=200)
+    p.set_defaults(func=benchFormation)
+
+    p = sub.add_parser('shard', help='telemetry throughput against worker process count')
+    p.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    p.add_argument('--drones', type=int, default=64)
+    p.add_argument('--warmup', type=float, default=1.0)
+    p.add_argument('--duration', type=float, default=3.0)
+    p.set_defaults(func=benchShard)
+
+    p = sub.add_parser('connect', help='serial vs parallel fleet bring-up and reconnect with a fake mavsdk System')
+    p.add_argument('--drones', type=int, default=16)
+    p.add_argument('--linkDelay', type=float, nargs=2, default=[0.05, 0.4])
+    p.add_argument('--healthDelay', type=float, nargs=2, default=[0.1, 0.8])
+    p.add_argument('--failures', type=int, default=2, help='connect attempts of drone 0 that hang')
+    p.add_argument('--connectTimeout', type=float, default=0.5,
+                   help='must exceed the slowest link delay or that drone never links')
+    p.add_argument('--reconnectDelay', type=float, default=0.05)
+    p.add_argument('--dropFor', type=float, default=0.5)
+    p.add_argument('--serverStart', type=float, default=0.1, help='stand-in mavsdk_server start-up time')
+    p.set_defaults(func=benchConnect)
+
+    p = sub.add_parser('pool', help='mavsdk_server spawn per connect vs warm pool, with a stand-in server')
+    p.add_argument('--drones', type=int, default=8)
+    p.add_argument('--cycles', type=int, default=3)
+    p.add_argument('--serverStart', type=float, default=0.1, help='stand-in mavsdk_server start-up time')
+    p.add_argument('--maxServers', type=int, default=10)
+    p.add_argument('--extra', type=int, default=4, help='addresses connected after the pool is warm')
+    p.add_argument('--idleTimeout', type=float, default=1.0)
+    p.set_defaults(func=benchPool)
+
+    p = sub.add_parser('ready', help='serial vs parallel swarm arm + offboard entry with a readiness barrier')
+    p.add_argument('--followers', type=int, nargs='+', default=[4, 16, 64])
+    p.add_argument('--failureRate', type=float, default=0.05)
+    p.add_argument('--quorum', type=float, default=0.8)
+    p.set_defaults(func=benchReady)
+
+    p = sub.add_parser('swarms', help='many concurrent swarms: shared batching tick scheduler vs a task per swarm')
+    p.add_argument('--swarms', type=int, nargs='+', default=[1, 10, 50])
+    p.add_argument('--followers', type=int, default=10, help='followers per swarm')
+    p.add_argument('--rate', type=float, default=10.0)
+    p.add_argument('--mixed', action='store_true', help='swarms follow at 1x, 0.5x and 2x the rate in turn')
+    p.add_argument('--latency', type=float, default=0.002)
+    p.add_argument('--duration', type=float, default=3.0)
+    p.set_defaults(func=benchSwarms)
+
+    p = sub.add_parser('pump', help='offboard setpoint resend rate and CPU: shared pump vs a task per drone')
+    p.add_argument('--drones', type=int, nargs='+', default=[10, 100, 500])
+    p.add_argument('--rate', type=float, default=50.0)
+    p.add_argument('--latency', type=float, default=0.002)
+    p.add_argument('--duration', type=float, default=3.0)
+    p.set_defaults(func=benchPump)
+
+    p = sub.add_parser('stream', help='JSON vs binary vs delta telemetry stream bytes/s and encode CPU')
+    p.add_argument('--log', help='recorded flight csv: time,index,latitude,longitude,altitude,heading')
+    p.add_argument('--drones', type=int, default=10)
+    p.add_argument('--duration', type=float, default=120.0)
+    p.add_argument('--rate', type=float, default=10.0, help='synthetic GPS sample rate')
+    p.add_argument('--frameRate', type=float, default=20.0)
+    p.add_argument('--loss', type=float, default=0.0, help='fraction of delta frames lost on the link')
+    p.add_argument('--ackLag', type=int, default=2, help='frames until an ack reaches the server')
+    p.set_defaults(func=benchStream)
+
+    p = sub.add_parser('filter', help='telemetry deadband / change filter on a hovering vehicle')
+    p.add_argument('--duration', type=float, default=60.0)
+    p.add_argument('--rate', type=float, default=50.0)
+    p.set_defaults(func=benchFilter)
+
+    p = sub.add_parser('mode', help='Qt main.py vs headless.py startup, memory and command latency')
+    p.add_argument('--modes', nargs='+', choices=('qt', 'headless'), default=['qt', 'headless'])
+    p.add_argument('--count', type=int, default=500)
+    p.add_argument('--timeout', type=float, default=20.0)
+    p.set_defaults(func=benchMode)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
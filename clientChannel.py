@@ -0,0 +1,141 @@
+from collections import deque
+import logging
+import time
+
+logger = logging.getLogger()
+
+
+class ClientChannel:
+    # socket 버퍼에 이만큼 쌓여 있으면 더 쓰지 않고 queue 에서 기다린다
+    SOCKET_HIGH_WATER = 64 * 1024
+    MAX_QUEUED_BYTES = 1024 * 1024
+    # 느린 client 를 끊는 기준: 연속으로 버린 telemetry 수, 또는 버릴 수 없는 메시지의 누적 크기
+    MAX_DROPS = 200
+    MAX_RELIABLE_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, socket, codec, peer=''):
+        self.socket = socket
+        self.codec = codec
+        self.framer = codec.newFramer()
+        self.stream = codec.newStream()
+        self.peer = peer
+
+        self._queue = deque()
+        self._queuedBytes = 0
+        self._reliableBytes = 0
+        self._dropsInRow = 0
+        self.overloaded = False
+        self.dropped = 0
+        self.sent = 0
+        self.maxQueuedBytes = 0
+
+        self._drones = None
+        self._types = None
+        self._minInterval = 0.0
+        self._lastFrameTime = 0.0
+        self._pendingItems = dict()
+
+    def setCodec(self, codec):
+        self.codec = codec
+        self.framer = codec.newFramer()
+        self.stream = codec.newStream()
+
+    def encodeFrame(self, items):
+        # delta 처럼 client 별 상태가 있는 codec 은 client 마다 따로 encode 한다. 보낼 것이 없으면 None
+        if self.stream is not None:
+            return self.stream.encodeFrame(items)
+        return self.codec.encodeFrame(items)
+
+    @property
+    def subscribed(self):
+        return self._drones is not None or self._types is not None or self._minInterval > 0
+
+    def subscribe(self, drones, types, maxRate):
+        # 빈 list 는 전체, maxRate 0 은 telemetry frame 주기 그대로
+        self._drones = frozenset(drones) if drones else None
+        self._types = frozenset(types) if types else None
+        self._minInterval = 1 / maxRate if maxRate > 0 else 0.0
+        self._pendingItems.clear()
+
+    def accepts(self, msgType, value):
+        if self._types is not None and msgType not in self._types:
+            return False
+        if self._drones is not None and value[0] not in self._drones:
+            return False
+        return True
+
+    def filterFrame(self, items, now=None):
+        for msgType, value in items:
+            if self.accepts(msgType, value):
+                self._pendingItems[(msgType, value[0])] = value
+
+        if not self._pendingItems:
+            return None
+        now = time.monotonic() if now is None else now
+        if now - self._lastFrameTime < self._minInterval:
+            return None
+
+        self._lastFrameTime = now
+        result = [[msgType, value] for (msgType, _), value in self._pendingItems.items()]
+        self._pendingItems.clear()
+        return result
+
+    def enqueue(self, message, droppable=False):
+        if self.overloaded:
+            return
+
+        self._queue.append((droppable, message))
+        self._queuedBytes += len(message)
+        if not droppable:
+            self._reliableBytes += len(message)
+        self.maxQueuedBytes = max(self.maxQueuedBytes, self._queuedBytes)
+
+        if self._queuedBytes > self.MAX_QUEUED_BYTES:
+            self._dropOldestTelemetry()
+
+        if self._reliableBytes > self.MAX_RELIABLE_BYTES or self._dropsInRow > self.MAX_DROPS:
+            logger.debug(f'client {self.peer} overloaded, queued: {self._queuedBytes}, drops: {self._dropsInRow}')
+            self.overloaded = True
+            self._queue.clear()
+            self._queuedBytes = 0
+            self._reliableBytes = 0
+
+    def pump(self):
+        while self._queue and self.socket.bytesToWrite() < self.SOCKET_HIGH_WATER:
+            droppable, message = self._queue.popleft()
+            self._queuedBytes -= len(message)
+            if not droppable:
+                self._reliableBytes -= len(message)
+            self.socket.write(message)
+            self.sent += 1
+
+        if not self._queue:
+            self._dropsInRow = 0
+
+    def stats(self):
+        return {'peer': self.peer,
+                'codec': self.codec.name,
+                'queuedMessages': len(self._queue),
+                'queuedBytes': self._queuedBytes,
+                'maxQueuedBytes': self.maxQueuedBytes,
+                'socketBytes': self.socket.bytesToWrite(),
+                'sent': self.sent,
+                'dropped': self.dropped,
+                'overloaded': self.overloaded,
+                'stream': self.stream.stats() if self.stream is not None else None,
+                'subscription': {'drones': sorted(self._drones) if self._drones is not None else [],
+                                 'types': sorted(self._types) if self._types is not None else [],
+                                 'maxRate': 1 / self._minInterval if self._minInterval else 0.0}}
+
+    def _dropOldestTelemetry(self):
+        kept = deque()
+        while self._queue and self._queuedBytes > self.MAX_QUEUED_BYTES:
+            droppable, message = self._queue.popleft()
+            if droppable:
+                self._queuedBytes -= len(message)
+                self.dropped += 1
+                self._dropsInRow += 1
+            else:
+                kept.append((droppable, message))
+        kept.extend(self._queue)
+        self._queue = kept
@@ -0,0 +1,176 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+
+
+class _Lane:
+    def __init__(self, name):
+        self.name = name
+        self.queue = asyncio.Queue()
+        self.task = None
+        self.busy = False
+        self.processed = 0
+        self.waitTotal = 0.0
+        self.waitMax = 0.0
+        self.pending = dict()
+        self.stale = 0
+        self.keyed = 0
+        self.dropped = 0
+
+    def stats(self):
+        return {'depth': self.queue.qsize() - self.stale,
+                'busy': self.busy,
+                'processed': self.processed,
+                'keyed': self.keyed,
+                'dropped': self.dropped,
+                'waitAvg': self.waitTotal / self.processed if self.processed else 0.0,
+                'waitMax': self.waitMax}
+
+
+class CommandBridge:
+    DEFAULT_LANE = 'main'
+    SWARM_LANE = 'swarm'
+    FINISH_TIMEOUT = 5.0
+    CALL_TIMEOUT = 1.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loopThread = None
+        self._finished = None
+        self._lanes = dict()
+        self._backlog = list()
+
+    def put(self, item, lane=None, coalesce=None):
+        # Qt 스레드에서 호출될 수 있으므로 이벤트 루프에 직접 넣지 않고 call_soon_threadsafe 로 전달
+        # coalesce 키가 있는 명령(setpoint)은 같은 lane 에 대기 중인 이전 명령을 대체한다
+        entry = (self.DEFAULT_LANE if lane is None else lane, time.monotonic(), item, coalesce)
+        with self._lock:
+            if self._loop is None:
+                self._backlog.append(entry)
+                return
+            loop = self._loop
+
+        # headless 모드처럼 loop 스레드에서 호출하면 바로 lane 에 넣는다
+        if threading.get_ident() == self._loopThread:
+            self._dispatch(*entry)
+            return
+
+        try:
+            loop.call_soon_threadsafe(self._dispatch, *entry)
+        except RuntimeError:
+            logger.debug(f'event loop is closed, drop: {item}')
+
+    @classmethod
+    def swarmLane(cls, swarmId):
+        # swarm 마다 lane 을 따로 둬서 한 swarm 의 긴 준비가 다른 swarm 의 명령을 막지 않는다
+        return f'{cls.SWARM_LANE}{swarmId}'
+
+    def closeLane(self, lane):
+        # loop 스레드에서 호출한다. 이미 들어온 명령을 모두 실행한 뒤 lane task 가 끝난다
+        target = self._lanes.pop(lane, None)
+        if target is not None:
+            target.queue.put_nowait([time.monotonic(), None, None])
+
+    def call(self, func, timeout=CALL_TIMEOUT):
+        # loop 스레드에서 func 를 실행하고 결과를 기다린다. loop 가 바꾸는 상태를 한 시점에 읽을 때 사용한다
+        with self._lock:
+            loop = self._loop
+        if loop is None or threading.get_ident() == self._loopThread:
+            return func()
+
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(func())
+            except Exception as e:
+                future.set_exception(e)
+
+        loop.call_soon_threadsafe(run)
+        return future.result(timeout)
+
+    def stats(self):
+        return {name: lane.stats() for name, lane in list(self._lanes.items())}
+
+    def _dispatch(self, lane, timestamp, item, coalesce=None):
+        if item is None or item == 'finish':
+            logger.debug('finish')
+            self._finished.set()
+            return
+
+        target = self._lanes.get(lane)
+        if target is None:
+            target = _Lane(lane)
+            target.task = asyncio.ensure_future(self._runLane(target))
+            self._lanes[lane] = target
+
+        entry = [timestamp, item, coalesce]
+        if coalesce is None:
+            # 뒤에 다른 명령이 들어온 setpoint 는 그 명령보다 먼저 실행되어야 하므로 더 이상 대체하지 않는다
+            target.pending.clear()
+        else:
+            target.keyed += 1
+            previous = target.pending.get(coalesce)
+            if previous is not None:
+                previous[1] = None
+                target.stale += 1
+                target.dropped += 1
+            target.pending[coalesce] = entry
+        target.queue.put_nowait(entry)
+
+    async def _runLane(self, lane):
+        while True:
+            entry = await lane.queue.get()
+            timestamp, data, coalesce = entry
+            if coalesce is not None:
+                if data is None:
+                    lane.stale -= 1
+                    continue
+                if lane.pending.get(coalesce) is entry:
+                    del lane.pending[coalesce]
+            if data is None:
+                break
+
+            wait = time.monotonic() - timestamp
+            lane.waitTotal += wait
+            lane.waitMax = max(lane.waitMax, wait)
+
+            logger.debug(f'lane: {lane.name}, data: {data}')
+            method, args = data
+            lane.busy = True
+            try:
+                await method(*args)
+            except Exception as e:
+                logger.exception(f'lane {lane.name} command failed: {e}')
+            finally:
+                lane.busy = False
+                lane.processed += 1
+
+    async def run(self):
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._loopThread = threading.get_ident()
+            self._finished = asyncio.Event()
+            for entry in self._backlog:
+                self._dispatch(*entry)
+            self._backlog.clear()
+
+        try:
+            await self._finished.wait()
+
+            tasks = [lane.task for lane in self._lanes.values()]
+            for lane in self._lanes.values():
+                lane.queue.put_nowait([time.monotonic(), None, None])
+            if tasks:
+                _, pending = await asyncio.wait(tasks, timeout=self.FINISH_TIMEOUT)
+                for task in pending:
+                    task.cancel()
+        finally:
+            with self._lock:
+                self._loop = None
+                self._loopThread = None
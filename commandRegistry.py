@@ -0,0 +1,115 @@
+import logging
+
+logger = logging.getLogger()
+
+DRONE_INDEX = 'droneIndex'
+
+
+class CommandError(Exception):
+    pass
+
+
+class _Command:
+    def __init__(self, commandId, name, handler, argTypes, checkers, withClient, defaults=()):
+        self.id = commandId
+        self.name = name
+        self.handler = handler
+        self.argTypes = argTypes
+        self.checkers = checkers
+        self.withClient = withClient
+        # 뒤쪽 인자들의 기본값. 이 개수만큼은 생략할 수 있다
+        self.defaults = defaults
+        self.required = len(checkers) - len(defaults)
+
+
+class CommandRegistry:
+    instance = None
+
+    def __init__(self):
+        self._commands = dict()
+        self._droneCount = lambda: 0
+
+    @classmethod
+    def getInstance(cls):
+        if cls.instance is None:
+            cls.instance = CommandRegistry()
+        return cls.instance
+
+    def setDroneCount(self, droneCount):
+        self._droneCount = droneCount
+
+    def register(self, name, handler, argTypes=(), withClient=False, defaults=()):
+        argTypes = tuple(argTypes)
+        defaults = tuple(defaults)
+        if len(defaults) > len(argTypes):
+            raise ValueError(f'{name}: more defaults than args')
+        checkers = tuple(self._compile(name, position, argType) for position, argType in enumerate(argTypes))
+        previous = self._commands.get(name)
+        commandId = previous.id if previous else len(self._commands) + 1
+        self._commands[name] = _Command(commandId, name, handler, argTypes, checkers, withClient, defaults)
+
+    def names(self):
+        return list(self._commands)
+
+    def commands(self):
+        return list(self._commands.values())
+
+    def dispatch(self, func, args, client=None):
+        command = self._commands.get(func)
+        if command is None:
+            raise CommandError(f'unknown command: {func}')
+        if not isinstance(args, (list, tuple)):
+            raise CommandError(f'{func}: args must be a list')
+        if not command.required <= len(args) <= len(command.checkers):
+            expected = len(command.checkers)
+            if command.required < expected:
+                expected = f'{command.required} to {expected}'
+            raise CommandError(f'{func}: expected {expected} args, got {len(args)}')
+        if len(args) < len(command.checkers):
+            args = list(args) + list(command.defaults[len(args) - command.required:])
+
+        args = [check(value) for check, value in zip(command.checkers, args)]
+        if command.withClient:
+            return command.handler(client, *args)
+        return command.handler(*args)
+
+    def _compile(self, name, position, argType):
+        def fail(value, expected):
+            raise CommandError(f'{name}: arg {position} must be {expected}, got {value!r}')
+
+        if argType is DRONE_INDEX:
+            def check(value):
+                if isinstance(value, bool) or not isinstance(value, int):
+                    fail(value, 'a drone index')
+                if not 0 <= value < self._droneCount():
+                    fail(value, f'a drone index in [0, {self._droneCount()})')
+                return value
+        elif argType is int:
+            def check(value):
+                if isinstance(value, bool) or not isinstance(value, int):
+                    fail(value, 'int')
+                return value
+        elif argType is float:
+            def check(value):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    fail(value, 'float')
+                return float(value)
+        elif argType is str:
+            def check(value):
+                if not isinstance(value, str):
+                    fail(value, 'str')
+                return value
+        elif argType is list:
+            def check(value):
+                if not isinstance(value, list):
+                    fail(value, 'list')
+                return value
+        elif argType is bool:
+            def check(value):
+                if not isinstance(value, bool):
+                    fail(value, 'bool')
+                return value
+        else:
+            raise ValueError(f'{name}: unsupported arg type {argType!r}')
+
+        return check
@@ -0,0 +1,707 @@
+import asyncio
+import logging
+import time
+from mavsdk import System
+from mavsdk.offboard import (OffboardError, VelocityBodyYawspeed, VelocityNedYaw, Attitude, PositionNedYaw,
+                             PositionGlobalYaw)
+from mavsdk.action import ActionError
+from mavsdk.param import ParamError
+from telemetryAggregator import TelemetryAggregator
+from telemetryFilter import TelemetryFilter
+from droneState import DroneState, VersionClock
+from serverPool import ServerPool
+from setpointPump import SetpointPump
+
+logger = logging.getLogger()
+
+
+class DroneCore:
+    # Qt 없이 asyncio 만으로 동작하는 드론. GUI 에서 signal 이 필요하면 DroneProxy 를 쓴다
+    DISCONNECTED = 'disconnected'
+    CONNECTING = 'connecting'
+    WAITING_FOR_HEALTH = 'waitingForHealth'
+    READY = 'ready'
+    LOST = 'lost'
+    RECONNECTING = 'reconnecting'
+
+    CONNECT_TIMEOUT = 10.0
+    # 재연결 대기 시간은 실패할 때마다 두 배로 늘린다
+    RECONNECT_DELAY = 1.0
+    MAX_RECONNECT_DELAY = 30.0
+
+    def __init__(self, index=0):
+        self._drone = None
+        self._server = None
+        self._index = index
+        self._systemId = None
+
+        self._task_status_text = None
+        self._task_armed = None
+        self._task_flight_mode = None
+        self._task_position = None
+        self._task_heading = None
+        self._task_velocity = None
+        self._task_connection = None
+
+        self._statusText = ''
+        self._isConnected = False
+        self._connectionState = self.DISCONNECTED
+        self._isArmed = False
+        self._flightMode = ''
+        self._state = DroneState.empty()
+        self._version = 0
+        self._activeSetpoint = None
+        self._setpointSentAt = 0.0
+        self._setpointsSent = 0
+
+        """
+        velocity_body
+        """
+        self._velocity_forward = 0
+        self._velocity_right = 0
+        self._velocity_down = 0
+        self._yaw_angular_rate = 0
+        """
+        velocity_ned
+        """
+        self._velocity_north = 0
+        self._velocity_east = 0
+        self._velocity_down_ned = 0
+        self._yaw_in_degrees = 0
+        """
+        attitude
+        """
+        self._roll_deg = 0
+        self._pitch_deg = 0
+        self._yaw_deg = 0
+        self._thrust_value = 0
+        """
+        position_ned
+        """
+        self._position_ned_north_m = 0
+        self._position_ned_east_m = 0
+        self._position_ned_down_m = 0
+        self._position_ned_yaw_deg = 0
+        """
+        position_global
+        """
+        self._position_global_latitude_m = 0
+        self._position_global_longitude_m = 0
+        self._position_global_altitude_m = 0
+        self._position_global_yaw_deg = 0
+
+    def __del__(self):
+        logger.debug("")
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def statusText(self):
+        return self._statusText
+
+    @statusText.setter
+    def statusText(self, val: str):
+        self._statusText = val
+
+    @property
+    def isConnected(self):
+        return self._isConnected
+
+    @isConnected.setter
+    def isConnected(self, val: bool):
+        self._isConnected = val
+
+    @property
+    def connectionState(self):
+        return self._connectionState
+
+    @connectionState.setter
+    def connectionState(self, val: str):
+        self._connectionState = val
+
+    @property
+    def isArmed(self):
+        return self._isArmed
+
+    @isArmed.setter
+    def isArmed(self, val: bool):
+        self._isArmed = val
+
+    @property
+    def flightMode(self):
+        return self._flightMode
+
+    @flightMode.setter
+    def flightMode(self, val: str):
+        self._flightMode = val
+
+    @property
+    def state(self):
+        return self._state
+
+    def _updateState(self, **fields):
+        # 여러 필드를 한 번에 바꾼 새 snapshot 으로 교체한다. follow 가 쓰는 값이므로 filter 와 관계없이 항상 갱신한다
+        self._state = self._state._replace(**fields)
+
+    def _stateChanged(self):
+        # TelemetryFilter 를 통과한 변화만 알린다. DroneProxy 는 여기에 signal 을 더한다
+        self._touch()
+
+    def _touch(self):
+        with VersionClock.getInstance() as version:
+            self._version = version
+
+    @property
+    def version(self):
+        return self._version
+
+    def setpoints(self):
+        return {'active': self._activeSetpoint,
+                'velocityBody': [self._velocity_forward, self._velocity_right, self._velocity_down,
+                                 self._yaw_angular_rate],
+                'velocityNed': [self._velocity_north, self._velocity_east, self._velocity_down_ned,
+                                self._yaw_in_degrees],
+                'attitude': [self._roll_deg, self._pitch_deg, self._yaw_deg, self._thrust_value],
+                'positionNed': [self._position_ned_north_m, self._position_ned_east_m, self._position_ned_down_m,
+                                self._position_ned_yaw_deg],
+                'positionGlobal': [self._position_global_latitude_m, self._position_global_longitude_m,
+                                   self._position_global_altitude_m, self._position_global_yaw_deg]}
+
+    @property
+    def activeSetpoint(self):
+        return self._activeSetpoint
+
+    @property
+    def setpointsSent(self):
+        return self._setpointsSent
+
+    def setpointAge(self, now=None):
+        now = time.monotonic() if now is None else now
+        return now - self._setpointSentAt
+
+    def _markSetpointSent(self):
+        self._setpointSentAt = time.monotonic()
+        self._setpointsSent += 1
+
+    def snapshot(self):
+        # getState 응답용. event loop 스레드에서 읽어야 필드들이 같은 시점의 값이 된다
+        state = self._state
+        return {'index': self._index,
+                'version': self._version,
+                'connected': self._isConnected,
+                'connectionState': self._connectionState,
+                'systemId': self._systemId,
+                'serverPort': self.serverPort,
+                'armed': self._isArmed,
+                'flightMode': self._flightMode,
+                'statusText': self._statusText,
+                'position': [state.latitude, state.longitude, state.altitude, state.altitude_absolute],
+                'heading': state.heading,
+                'velocity': [state.velocity_north, state.velocity_east, state.velocity_down],
+                'setpoints': self.setpoints()}
+
+    @property
+    def latitude(self):
+        return self._state.latitude
+
+    @property
+    def longitude(self):
+        return self._state.longitude
+
+    @property
+    def altitude(self):
+        return self._state.altitude
+
+    @property
+    def altitude_absolute(self):
+        return self._state.altitude_absolute
+
+    @property
+    def heading(self):
+        return self._state.heading
+
+    @property
+    def serverPort(self):
+        # ServerPool 에서 빌린 mavsdk_server 의 gRPC 포트. 빌리기 전이나 반납한 뒤에는 None
+        return self._server.port if self._server else None
+
+    @property
+    def systemId(self):
+        return self._systemId
+
+    def telemetry(self):
+        return self._drone.telemetry
+
+    async def cleanup(self):
+        logger.debug("cleanup")
+        if self._task_connection is not None:
+            self._task_connection.cancel()
+            self._task_connection = None
+        await self._cancel_tasks()
+        SetpointPump.getInstance().remove(self)
+
+        await self._releaseServer()
+
+        TelemetryFilter.getInstance().reset(self._index)
+        self._setLink(False)
+        self._setConnectionState(self.DISCONNECTED)
+
+    async def connect(self, addr: str):
+        # 연결은 백그라운드 state machine 이 맡고 바로 돌아온다. 진행 상황은 connectionState 이벤트로 알린다
+        if self._task_connection is not None and not self._task_connection.done():
+            logger.debug("Already connecting or connected.")
+            return
+
+        self._task_connection = asyncio.ensure_future(self._superviseConnection(addr))
+
+    async def _superviseConnection(self, addr):
+        delay = self.RECONNECT_DELAY
+        # 처음이나 연결 시도가 실패한 뒤에는 mavsdk_server 부터 다시 띄우고, link 만 끊긴 경우에는 살아 있는 server 에서 기다린다
+        restart = True
+        state = self.CONNECTING
+        while True:
+            self._setConnectionState(state)
+            logger.debug(f"Connecting to address: {addr}, restart: {restart}")
+            try:
+                if restart or self._drone is None:
+                    await self._attachServer(addr)
+                await asyncio.wait_for(self._link(addr, restart), timeout=self.CONNECT_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"Connection to drone failed: {e!r}, retry in {delay}s")
+                state = self.RECONNECTING
+                restart = True
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+                continue
+
+            logger.debug("Connected to drone successfully!")
+            self._setLink(True)
+            failed = False
+            try:
+                await self._readSystemId()
+                await self._waitReadyOrLost()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # mavsdk_server 가 죽으면 stream 이 gRPC 오류로 끝난다. 이때는 server 부터 다시 띄운다
+                logger.debug(f"Connection to drone failed: {e!r}")
+                failed = True
+
+            logger.debug("Link lost")
+            if self._connectionState == self.READY:
+                # READY 까지 갔던 연결이 끊긴 경우에만 backoff 를 처음부터 다시 센다.
+                # 연결 직후 바로 실패하는 link 나 server 는 계속 늘어나는 간격으로 재시도한다
+                delay = self.RECONNECT_DELAY
+            # 끊긴 server 의 telemetry stream 은 오류만 내므로 바로 멈춘다
+            await self._cancel_tasks()
+            # link 가 끊기면 PX4 도 offboard 를 벗어나므로 setpoint 재전송을 멈춘다
+            SetpointPump.getInstance().remove(self)
+            self._setLink(False)
+            self._setConnectionState(self.LOST)
+            state = self.RECONNECTING
+            restart = failed
+            if failed:
+                logger.debug(f"Restart mavsdk_server in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+
+    async def _attachServer(self, addr):
+        # 응답하지 않던 server 는 pool 로 돌려보내지 않고 종료한 뒤 새로 빌린다
+        await self._releaseServer(healthy=False)
+        self._server = await ServerPool.getInstance().checkout(addr)
+        self._drone = System(mavsdk_server_address='localhost', port=self._server.port)
+
+    async def _link(self, addr, restart):
+        if restart:
+            await self._drone.connect(system_address=addr)
+        async for connection in self._drone.core.connection_state():
+            if connection.is_connected:
+                return
+
+    async def _releaseServer(self, healthy=True):
+        self._drone = None
+        if self._server is not None:
+            server, self._server = self._server, None
+            await ServerPool.getInstance().release(server, healthy)
+
+    async def _waitLinkLost(self):
+        async for connection in self._drone.core.connection_state():
+            if not connection.is_connected:
+                return
+
+    async def _waitHealth(self):
+        logger.debug("Waiting for drone to have a global position estimate...")
+        async for health in self._drone.telemetry.health():
+            if health.is_global_position_ok and health.is_home_position_ok:
+                logger.debug("-- Global position estimate OK")
+                return
+
+    async def _waitReadyOrLost(self):
+        # health 를 기다리는 동안에도 link 가 끊기면 바로 LOST 로 간다. 두 stream 중 하나가 오류로 끝나면 예외를 올린다
+        self._setConnectionState(self.WAITING_FOR_HEALTH)
+        lost = asyncio.ensure_future(self._waitLinkLost())
+        health = asyncio.ensure_future(self._waitHealth())
+        try:
+            done, _ = await asyncio.wait((lost, health), return_when=asyncio.FIRST_COMPLETED)
+            if lost in done:
+                lost.result()
+                return
+            health.result()
+            # server 를 다시 띄우면 이전 stream 은 끊어지므로 telemetry task 는 매번 새로 만든다
+            await self._cancel_tasks()
+            self._startTelemetry()
+            self._setConnectionState(self.READY)
+            await lost
+        finally:
+            for task in (lost, health):
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # 먼저 올린 예외 말고 다른 task 의 예외도 꺼내서 never retrieved 경고를 남기지 않는다
+                    task.exception()
+
+    async def _readSystemId(self):
+        try:
+            self._systemId = await self._drone.param.get_param_int('MAV_SYS_ID')
+            logger.debug(f"system id: {self._systemId}")
+            self._touch()
+        except ParamError as error:
+            logger.debug(f"Reading MAV_SYS_ID failed with error: {error}")
+
+    def _setLink(self, connected):
+        if self._isConnected == connected:
+            return
+        self.isConnected = connected
+        self._touch()
+        TelemetryAggregator.getInstance().publish("connected", (self._index, connected))
+
+    def _setConnectionState(self, state):
+        if self._connectionState == state:
+            return
+        logger.debug(f"drone {self._index} connection state: {state}")
+        self.connectionState = state
+        self._touch()
+        TelemetryAggregator.getInstance().publish("connectionState", (self._index, state))
+
+    def _startTelemetry(self):
+        self._task_status_text = asyncio.ensure_future(self._print_status_text())
+        self._task_armed = asyncio.ensure_future(self._armed())
+        self._task_flight_mode = asyncio.ensure_future(self._flight_mode())
+        self._task_position = asyncio.ensure_future(self._position())
+        self._task_heading = asyncio.ensure_future(self._heading_coroutine())
+        self._task_velocity = asyncio.ensure_future(self._velocity_coroutine())
+
+    async def _print_status_text(self):
+        logger.debug('')
+        try:
+            async for status_text in self._drone.telemetry.status_text():
+                # logger.debug(f'status text: {status_text.text}')
+                self.statusText = status_text.text
+                self._touch()
+                TelemetryAggregator.getInstance().publish("statusText", (self._index, status_text.text))
+        except asyncio.CancelledError:
+            logger.debug("_print_status_text asyncio.CancelledError.")
+            return
+
+    async def _armed(self):
+        logger.debug('')
+        try:
+            async for is_armed in self._drone.telemetry.armed():
+                # logger.debug(f'is_armed: {is_armed}')
+                if not TelemetryFilter.getInstance().accept(self._index, 'armed', is_armed):
+                    continue
+                self.isArmed = is_armed
+                self._touch()
+                TelemetryAggregator.getInstance().publish("armed", (self._index, is_armed))
+        except asyncio.CancelledError:
+            logger.debug("_armed asyncio.CancelledError.")
+            return
+
+    async def _flight_mode(self):
+        logger.debug('')
+        try:
+            async for flight_mode in self._drone.telemetry.flight_mode():
+                # logger.debug(f'flight_mode: {flight_mode}')
+                if not TelemetryFilter.getInstance().accept(self._index, 'flightMode', flight_mode.name):
+                    continue
+                self.flightMode = flight_mode.name
+                self._touch()
+                TelemetryAggregator.getInstance().publish("flightMode", (self._index, flight_mode.name))
+        except asyncio.CancelledError:
+            logger.debug("_flight_mode asyncio.CancelledError.")
+            return
+
+    async def _position(self):
+        try:
+            async for position in self._drone.telemetry.position():
+                # self.positionChanged(position.latitude_deg, position.longitude_deg, position.relative_altitude_m)
+                now = time.monotonic()
+                self._updateState(latitude=position.latitude_deg,
+                                  longitude=position.longitude_deg,
+                                  altitude=position.relative_altitude_m,
+                                  altitude_absolute=position.absolute_altitude_m,
+                                  position_timestamp=now)
+                if not TelemetryFilter.getInstance().accept(self._index, 'position',
+                                                            (position.latitude_deg,
+                                                             position.longitude_deg,
+                                                             position.relative_altitude_m), now):
+                    continue
+                self._stateChanged()
+                TelemetryAggregator.getInstance().publish("position", (self._index,
+                                                                       position.latitude_deg,
+                                                                       position.longitude_deg,
+                                                                       position.relative_altitude_m))
+        except asyncio.CancelledError:
+            logger.debug("_position asyncio.CancelledError.")
+            return
+
+    async def _heading_coroutine(self):
+        try:
+            async for heading in self._drone.telemetry.heading():
+                # logger.debug(f'heading: {heading.heading_deg}')
+                now = time.monotonic()
+                self._updateState(heading=heading.heading_deg, heading_timestamp=now)
+                if not TelemetryFilter.getInstance().accept(self._index, 'heading', heading.heading_deg, now):
+                    continue
+                self._stateChanged()
+                TelemetryAggregator.getInstance().publish("heading", (self._index, heading.heading_deg))
+        except asyncio.CancelledError:
+            logger.debug("_heading asyncio.CancelledError.")
+            return
+
+    async def _velocity_coroutine(self):
+        try:
+            async for velocity in self._drone.telemetry.velocity_ned():
+                now = time.monotonic()
+                self._updateState(velocity_north=velocity.north_m_s,
+                                  velocity_east=velocity.east_m_s,
+                                  velocity_down=velocity.down_m_s,
+                                  velocity_timestamp=now)
+                if TelemetryFilter.getInstance().accept(self._index, 'velocity',
+                                                        (velocity.north_m_s, velocity.east_m_s, velocity.down_m_s),
+                                                        now):
+                    self._stateChanged()
+        except asyncio.CancelledError:
+            logger.debug("_velocity asyncio.CancelledError.")
+            return
+
+    async def _cancel_tasks(self):
+        if self._task_status_text is not None:
+            logger.debug("cancel status_text_task")
+            self._task_status_text.cancel()
+        if self._task_armed is not None:
+            logger.debug("cancel _task_armed")
+            self._task_armed.cancel()
+        if self._task_flight_mode is not None:
+            logger.debug("cancel _task_flight_mode")
+            self._task_flight_mode.cancel()
+        if self._task_position is not None:
+            logger.debug("cancel _task_position")
+            self._task_position.cancel()
+        if self._task_heading is not None:
+            logger.debug("cancel _task_heading")
+            self._task_heading.cancel()
+        if self._task_velocity is not None:
+            logger.debug("cancel _task_velocity")
+            self._task_velocity.cancel()
+
+        # await asyncio.wait(self._task_list)
+
+    async def arm(self):
+        # swarm 준비에서 드론별 결과를 모으므로 성공 여부를 돌려준다
+        if self._drone is None:
+            logger.debug("Arm failed: not connected")
+            return False
+        try:
+            await self._drone.action.arm()
+        except ActionError as error:
+            logger.debug(f"Arm failed with error: {error}")
+            return False
+        return True
+
+    async def disarm(self):
+        if self._drone is None:
+            logger.debug("Disarm failed: not connected")
+            return False
+        try:
+            await self._drone.action.disarm()
+        except ActionError as error:
+            logger.debug(f"Disarm failed with error: {error}")
+            return False
+        return True
+
+    async def start_offboard_mode(self):
+        if self._drone is None:
+            logger.debug("Starting offboard mode failed: not connected")
+            return False
+        try:
+            # offboard 시작 전에는 pump 가 이어서 보낼 setpoint 하나만 보낸다.
+            # 여러 종류를 함께 보내면 어느 것이 마지막에 도착했는지에 따라 offboard 가 다른 setpoint 로 시작한다
+            await self.resend_setpoint()
+            await self._drone.offboard.start()
+            # setpoint 가 끊기면 PX4 가 offboard 를 벗어나므로 client 명령과 관계없이 주기적으로 다시 보낸다
+            SetpointPump.getInstance().add(self)
+        except OffboardError as error:
+            logger.debug(f"Starting offboard mode failed with error code: \
+                  {error._result.result}")
+            logger.debug("-- Disarming")
+            try:
+                await self._drone.action.disarm()
+            except ActionError as error:
+                logger.debug(f"Disarm failed with error: {error}")
+            return False
+        return True
+
+    async def stop_offboard_mode(self):
+        if self._drone is None:
+            return False
+        try:
+            await self._drone.offboard.stop()
+        except OffboardError as error:
+            logger.debug(f"Stopping offboard mode failed with error code: \
+                  {error._result.result}")
+            return False
+        SetpointPump.getInstance().remove(self)
+        return True
+
+    async def resend_setpoint(self):
+        # SetpointPump 가 호출한다. 아직 setpoint 명령이 없었으면 제자리 유지(속도 0)를 보낸다
+        if self._drone is None:
+            return False
+        send = {'velocityBody': self._send_velocity_body,
+                'velocityNed': self._send_velocity_ned,
+                'attitude': self._send_attitude,
+                'positionNed': self._send_position_ned,
+                'positionGlobal': self._send_position_global}[self._activeSetpoint or 'velocityBody']
+        await send()
+        return True
+
+    async def set_velocity_body(self, forward, right, down, yaw):
+        logger.debug(f"velocity_forward: {forward}")
+        logger.debug(f"velocity_right: {right}")
+        logger.debug(f"velocity_down: {down}")
+        logger.debug(f"yaw_angular_rate: {yaw}")
+
+        self._velocity_forward = forward
+        self._velocity_right = right
+        self._velocity_down = down
+        self._yaw_angular_rate = yaw
+        self._activeSetpoint = 'velocityBody'
+        self._touch()
+
+        await self._send_velocity_body()
+
+        logger.debug(".")
+
+    async def set_velocity_ned(self, north, east, down, yaw):
+        logger.debug(f"velocity_north: {north}")
+        logger.debug(f"velocity_east: {east}")
+        logger.debug(f"velocity_down_ned: {down}")
+        logger.debug(f"yaw_in_degrees: {yaw}")
+
+        self._velocity_north = north
+        self._velocity_east = east
+        self._velocity_down_ned = down
+        self._yaw_in_degrees = yaw
+        self._activeSetpoint = 'velocityNed'
+        self._touch()
+
+        await self._send_velocity_ned()
+
+        logger.debug(".")
+
+    async def set_attitude(self, roll, pitch, yaw, thrust):
+        logger.debug(f"roll_deg: {roll}")
+        logger.debug(f"pitch_deg: {pitch}")
+        logger.debug(f"yaw_deg: {yaw}")
+        logger.debug(f"thrust_value: {thrust}")
+
+        self._roll_deg = roll
+        self._pitch_deg = pitch
+        self._yaw_deg = yaw
+        self._thrust_value = thrust
+        self._activeSetpoint = 'attitude'
+        self._touch()
+
+        await self._send_attitude()
+
+        logger.debug(".")
+
+    async def set_position_ned(self, north, east, down, yaw):
+        logger.debug(f"position_ned_north: {north}")
+        logger.debug(f"position_ned_east: {east}")
+        logger.debug(f"position_ned_down: {down}")
+        logger.debug(f"position_ned_yaw_deg: {yaw}")
+
+        self._position_ned_north_m = north
+        self._position_ned_east_m = east
+        self._position_ned_down_m = down
+        self._position_ned_yaw_deg = yaw
+        self._activeSetpoint = 'positionNed'
+        self._touch()
+
+        await self._send_position_ned()
+
+        logger.debug(".")
+
+    async def set_position_global(self, lat, lon, alt, yaw):
+        # logger.debug(f"position_global_latitude: {lat}")
+        # logger.debug(f"position_global_longitude: {lon}")
+        # logger.debug(f"position_global_altitude: {alt}")
+        # logger.debug(f"position_global_yaw_deg: {yaw}")
+
+        self._position_global_latitude_m = lat
+        self._position_global_longitude_m = lon
+        self._position_global_altitude_m = alt
+        self._position_global_yaw_deg = yaw
+        self._activeSetpoint = 'positionGlobal'
+        self._touch()
+
+        await self._send_position_global()
+
+        # logger.debug(".")
+
+    async def _send_velocity_body(self):
+        await self._drone.offboard.set_velocity_body(
+            VelocityBodyYawspeed(self._velocity_forward,
+                                 self._velocity_right,
+                                 self._velocity_down,
+                                 self._yaw_angular_rate))
+        self._markSetpointSent()
+
+    async def _send_velocity_ned(self):
+        await self._drone.offboard.set_velocity_ned(
+            VelocityNedYaw(self._velocity_north,
+                           self._velocity_east,
+                           self._velocity_down_ned,
+                           self._yaw_in_degrees))
+        self._markSetpointSent()
+
+    async def _send_attitude(self):
+        await self._drone.offboard.set_attitude(
+            Attitude(self._roll_deg,
+                     self._pitch_deg,
+                     self._yaw_deg,
+                     self._thrust_value))
+        self._markSetpointSent()
+
+    async def _send_position_ned(self):
+        await self._drone.offboard.set_position_ned(
+            PositionNedYaw(self._position_ned_north_m,
+                           self._position_ned_east_m,
+                           self._position_ned_down_m,
+                           self._position_ned_yaw_deg))
+        self._markSetpointSent()
+
+    async def _send_position_global(self):
+        await self._drone.offboard.set_position_global(
+            PositionGlobalYaw(self._position_global_latitude_m,
+                              self._position_global_longitude_m,
+                              self._position_global_altitude_m,
+                              self._position_global_yaw_deg,
+                              altitude_type=PositionGlobalYaw.AltitudeType.AMSL))
+        self._markSetpointSent()
@@ -0,0 +1,62 @@
+import logging
+import threading
+
+logger = logging.getLogger()
+
+
+class DroneRegistry:
+    MAX_DRONES = 1024
+
+    def __init__(self, factory, maxDrones=MAX_DRONES):
+        self._factory = factory
+        self._maxDrones = maxDrones
+        self._lock = threading.Lock()
+        self._drones = dict()
+        self._systemIds = dict()
+
+    @property
+    def maxDrones(self):
+        return self._maxDrones
+
+    def __len__(self):
+        return len(self._drones)
+
+    def get(self, index):
+        return self._drones.get(index)
+
+    def drones(self):
+        return list(self._drones.values())
+
+    def getOrCreate(self, index):
+        # 드론은 connect 할 때 처음 만든다. gRPC 포트는 드론이 연결할 때 ServerPool 이 정한다
+        with self._lock:
+            drone = self._drones.get(index)
+            if drone is None:
+                if not 0 <= index < self._maxDrones:
+                    raise ValueError(f'drone index out of range: {index}')
+                drone = self._factory(index=index)
+                self._drones[index] = drone
+                logger.debug(f'created drone {index}')
+            return drone
+
+    def bindSystemId(self, index, systemId):
+        with self._lock:
+            self._systemIds[systemId] = index
+
+    def bySystemId(self, systemId):
+        # system id 는 연결 state machine 이 나중에 읽으므로, 기억해 둔 값이 없거나 바뀌었으면 드론 목록에서 다시 찾는다
+        index = self._systemIds.get(systemId)
+        drone = None if index is None else self._drones.get(index)
+        if drone is None or drone.systemId != systemId:
+            drone = next((drone for drone in self.drones() if drone.systemId == systemId), None)
+            if drone is not None:
+                self.bindSystemId(drone.index, systemId)
+        return drone
+
+    def detach(self, index):
+        # 목록에서만 뺀다. 연결 정리는 호출한 쪽이 드론의 lane 에서 cleanup 으로 한다
+        with self._lock:
+            drone = self._drones.pop(index, None)
+            for systemId in [sysid for sysid, bound in self._systemIds.items() if bound == index]:
+                del self._systemIds[systemId]
+            return drone
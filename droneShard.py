@@ -0,0 +1,343 @@
+import asyncio
+import importlib
+import itertools
+import logging
+import multiprocessing
+import threading
+
+from telemetryAggregator import TelemetryAggregator
+from droneState import DroneState, VersionClock
+from telemetryFilter import TelemetryFilter
+from serverPool import ServerPool
+from setpointPump import SetpointPump
+
+logger = logging.getLogger()
+
+
+def _loadFactory(spec):
+    module, name = spec.split(':')
+    return getattr(importlib.import_module(module), name)
+
+
+class _ShardWorker:
+    # worker 프로세스 안에서 자기 event loop 와 드론들을 소유한다. 메인 프로세스와는 pipe 하나로 통신한다
+    def __init__(self, conn, factory, flushRate):
+        self._conn = conn
+        self._factory = _loadFactory(factory)
+        self._flushInterval = 1 / flushRate
+        self._drones = dict()
+        self._sentStates = dict()
+        self._sentVersions = dict()
+        self._sendLock = threading.Lock()
+        self._loop = None
+        self._finished = None
+
+    def _send(self, message):
+        with self._sendLock:
+            self._conn.send(message)
+
+    def _receive(self):
+        while True:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                message = ('finish',)
+            self._loop.call_soon_threadsafe(self._handle, message)
+            if message[0] == 'finish':
+                break
+
+    def _handle(self, message):
+        kind = message[0]
+        if kind == 'create':
+            # 드론은 만들 때마다 새 key 를 받는다. 같은 index 를 다시 연결해도 이전 드론에 늦게 도착한 cleanup 이
+            # 새 드론에 가지 않고, 이전 드론은 그 cleanup 으로 정리된다
+            _, key, index = message
+            self._drones[key] = self._factory(index=index)
+        elif kind == 'call':
+            asyncio.ensure_future(self._call(*message[1:]))
+        elif kind == 'filter':
+            _, enabled, keyframeInterval, deadbands = message
+            telemetryFilter = TelemetryFilter.getInstance()
+            telemetryFilter.enabled = enabled
+            telemetryFilter.keyframeInterval = keyframeInterval
+            for field, value in deadbands.items():
+                telemetryFilter.setDeadband(field, value)
+        elif kind == 'setpointRate':
+            SetpointPump.getInstance().rate = message[1]
+        elif kind == 'finish':
+            self._finished.set()
+
+    async def _call(self, requestId, key, method, args):
+        drone = self._drones.get(key)
+        try:
+            if drone is None:
+                raise RuntimeError(f'drone {key} does not exist in this shard')
+            result = await getattr(drone, method)(*args)
+            if method == 'connect':
+                result = (drone.isConnected, drone.systemId)
+            elif method == 'cleanup':
+                self._forget(key, drone)
+            self._send(('result', requestId, True, result))
+        except Exception as e:
+            self._send(('result', requestId, False, repr(e)))
+
+    def _forget(self, key, drone):
+        if self._drones.get(key) is drone:
+            del self._drones[key]
+        self._sentStates.pop(key, None)
+        self._sentVersions.pop(key, None)
+
+    async def _flushLoop(self):
+        # telemetry 는 샘플마다 보내지 않고 주기마다 한 메시지로 묶어서 보낸다
+        aggregator = TelemetryAggregator.getInstance()
+        while True:
+            await asyncio.sleep(self._flushInterval)
+            aggregator.flush()
+
+            # 위치 snapshot 은 샘플마다, getState 용 snapshot 은 version 이 바뀐 경우에만 보낸다
+            states = list()
+            for key, drone in list(self._drones.items()):
+                state = drone.state
+                snapshot = None
+                if self._sentVersions.get(key) != drone.version:
+                    self._sentVersions[key] = drone.version
+                    snapshot = drone.snapshot()
+                if self._sentStates.get(key) is not state or snapshot is not None:
+                    self._sentStates[key] = state
+                    states.append((key, tuple(state), snapshot))
+            if states:
+                self._send(('states', states))
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._finished = asyncio.Event()
+
+        aggregator = TelemetryAggregator.getInstance()
+        aggregator.setSinks(lambda items: self._send(('frame', items)),
+                            lambda msgType, value: self._send(('event', msgType, value)))
+
+        threading.Thread(target=self._receive, daemon=True).start()
+        flushTask = asyncio.ensure_future(self._flushLoop())
+        await self._finished.wait()
+
+        flushTask.cancel()
+        for drone in list(self._drones.values()):
+            await drone.cleanup()
+        await ServerPool.getInstance().close()
+
+
+def shardMain(conn, factory, flushRate):
+    asyncio.run(_ShardWorker(conn, factory, flushRate).run())
+
+
+class RemoteDrone:
+    # 메인 프로세스에서 DroneCore 대신 사용. 명령은 shard 로 보내고 상태는 shard 가 보내준 snapshot 을 쓴다
+    def __init__(self, shard, index, key, release):
+        self._shard = shard
+        self._index = index
+        self._key = key
+        self._release = release
+        self._systemId = None
+        self._isConnected = False
+        self._state = DroneState.empty()
+        self._snapshot = None
+        self._version = 0
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def serverPort(self):
+        snapshot = self._snapshot
+        return snapshot.get('serverPort') if snapshot is not None else None
+
+    @property
+    def systemId(self):
+        return self._systemId
+
+    @property
+    def isConnected(self):
+        return self._isConnected
+
+    @property
+    def state(self):
+        return self._state
+
+    async def connect(self, addr):
+        self._isConnected, self._systemId = await self._shard.call(self._key, 'connect', (addr,))
+
+    async def cleanup(self):
+        try:
+            await self._shard.call(self._key, 'cleanup', ())
+        finally:
+            self._isConnected = False
+            self._release(self._key)
+
+    @property
+    def version(self):
+        return self._version
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {'index': self._index, 'version': self._version, 'connected': self._isConnected,
+                    'systemId': self._systemId}
+        return dict(snapshot, version=self._version)
+
+    def updateState(self, state, snapshot=None):
+        self._state = state
+        if snapshot is not None:
+            # 연결은 worker 의 state machine 이 진행하므로 연결 상태와 system id 도 snapshot 에서 받는다
+            self._isConnected = snapshot['connected']
+            self._systemId = snapshot['systemId']
+            # version 은 메인 프로세스의 VersionClock 으로 다시 매긴다
+            with VersionClock.getInstance() as version:
+                self._snapshot = snapshot
+                self._version = version
+
+    async def arm(self):
+        return await self._shard.call(self._key, 'arm', ())
+
+    async def start_offboard_mode(self):
+        return await self._shard.call(self._key, 'start_offboard_mode', ())
+
+    async def stop_offboard_mode(self):
+        return await self._shard.call(self._key, 'stop_offboard_mode', ())
+
+    async def set_velocity_body(self, forward, right, down, yaw):
+        await self._shard.call(self._key, 'set_velocity_body', (forward, right, down, yaw))
+
+    async def set_velocity_ned(self, north, east, down, yaw):
+        await self._shard.call(self._key, 'set_velocity_ned', (north, east, down, yaw))
+
+    async def set_attitude(self, roll, pitch, yaw, thrust):
+        await self._shard.call(self._key, 'set_attitude', (roll, pitch, yaw, thrust))
+
+    async def set_position_ned(self, north, east, down, yaw):
+        await self._shard.call(self._key, 'set_position_ned', (north, east, down, yaw))
+
+    async def set_position_global(self, lat, lon, alt, yaw):
+        await self._shard.call(self._key, 'set_position_global', (lat, lon, alt, yaw))
+
+
+class _Shard:
+    def __init__(self, context, factory, flushRate, onStates):
+        self._conn, self._child = context.Pipe()
+        self._process = context.Process(target=shardMain, args=(self._child, factory, flushRate), daemon=True)
+        self._sendLock = threading.Lock()
+        self._requestIds = itertools.count()
+        self._pending = dict()
+        self._onStates = onStates
+        self._reader = threading.Thread(target=self._receive, daemon=True)
+        self.messages = 0
+
+    def start(self):
+        self._process.start()
+        # 자식 쪽 끝을 닫아둬야 worker 가 죽었을 때 recv 가 EOFError 로 끝난다
+        self._child.close()
+        self._reader.start()
+
+    def send(self, message):
+        with self._sendLock:
+            self._conn.send(message)
+
+    async def call(self, key, method, args):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        requestId = next(self._requestIds)
+        self._pending[requestId] = (loop, future)
+        self.send(('call', requestId, key, method, args))
+        return await future
+
+    def _receive(self):
+        aggregator = TelemetryAggregator.getInstance()
+        while True:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                logger.debug('shard pipe closed')
+                for requestId in list(self._pending):
+                    loop, future = self._pending.pop(requestId)
+                    loop.call_soon_threadsafe(self._resolve, future, False, 'shard process exited')
+                break
+            self.messages += 1
+
+            kind = message[0]
+            if kind == 'states':
+                self._onStates(message[1])
+            elif kind == 'frame':
+                for msgType, value in message[1]:
+                    aggregator.publish(msgType, value)
+            elif kind == 'event':
+                aggregator.publish(message[1], message[2])
+            elif kind == 'result':
+                _, requestId, ok, payload = message
+                loop, future = self._pending.pop(requestId)
+                loop.call_soon_threadsafe(self._resolve, future, ok, payload)
+
+    @staticmethod
+    def _resolve(future, ok, payload):
+        if future.done():
+            return
+        if ok:
+            future.set_result(payload)
+        else:
+            future.set_exception(RuntimeError(payload))
+
+    def stop(self, timeout=5.0):
+        try:
+            self.send(('finish',))
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+
+
+class ShardPool:
+    def __init__(self, shards, factory='droneCore:DroneCore', flushRate=50.0):
+        context = multiprocessing.get_context('spawn')
+        self._drones = dict()
+        self._keys = itertools.count(1)
+        self._shards = [_Shard(context, factory, flushRate, self._updateStates) for _ in range(shards)]
+
+    def __len__(self):
+        return len(self._shards)
+
+    def start(self):
+        for shard in self._shards:
+            shard.start()
+
+    def stop(self):
+        for shard in self._shards:
+            shard.stop()
+
+    def configureFilter(self, enabled, keyframeInterval, deadbands):
+        for shard in self._shards:
+            shard.send(('filter', enabled, keyframeInterval, deadbands))
+
+    def configureSetpointRate(self, rate):
+        for shard in self._shards:
+            shard.send(('setpointRate', rate))
+
+    def createDrone(self, index):
+        # DroneRegistry 의 factory 로 사용한다. 드론은 index 로 shard 에 고정 배치된다
+        shard = self._shards[index % len(self._shards)]
+        key = next(self._keys)
+        shard.send(('create', key, index))
+        drone = RemoteDrone(shard, index, key, self._release)
+        self._drones[key] = drone
+        return drone
+
+    def _release(self, key):
+        self._drones.pop(key, None)
+
+    def stats(self):
+        return [{'shard': number, 'messages': shard.messages} for number, shard in enumerate(self._shards)]
+
+    def _updateStates(self, states):
+        for key, state, snapshot in states:
+            drone = self._drones.get(key)
+            if drone is not None:
+                drone.updateState(DroneState(*state), snapshot)
@@ -0,0 +1,57 @@
+from collections import namedtuple
+import threading
+import time
+
+_FIELDS = ('latitude', 'longitude', 'altitude', 'altitude_absolute', 'heading',
+           'velocity_north', 'velocity_east', 'velocity_down',
+           'position_timestamp', 'heading_timestamp', 'velocity_timestamp')
+
+# haversine 라이브러리의 평균 지구 반지름과 같은 값
+EARTH_RADIUS_M = 6371008.8
+
+
+class DroneState(namedtuple('DroneState', _FIELDS)):
+    # telemetry 가 들어올 때마다 _replace 로 새 객체를 만들어 한 번에 교체한다. 읽는 쪽은 한 객체만 보면 된다
+    __slots__ = ()
+
+    @classmethod
+    def empty(cls):
+        return cls(0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+    @property
+    def valid(self):
+        return self.position_timestamp > 0.0 and self.heading_timestamp > 0.0
+
+    def age(self, now=None):
+        # 위치와 헤딩 중 더 오래된 샘플 기준
+        now = time.monotonic() if now is None else now
+        return now - min(self.position_timestamp, self.heading_timestamp)
+
+
+class VersionClock:
+    # 드론/스웜 상태가 바뀔 때마다 fleet 전체에서 증가하는 version 을 발급한다.
+    # with 블록 안에서 저장까지 끝내야 읽는 쪽이 version 보다 오래된 값을 보지 않는다
+    instance = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+
+    @classmethod
+    def getInstance(cls):
+        if cls.instance is None:
+            cls.instance = VersionClock()
+        return cls.instance
+
+    @property
+    def version(self):
+        with self._lock:
+            return self._version
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._version += 1
+        return self._version
+
+    def __exit__(self, excType, exc, traceback):
+        self._lock.release()
@@ -0,0 +1,32 @@
+import math
+
+import numpy as np
+
+from droneState import EARTH_RADIUS_M
+
+
+class FormationSolver:
+    def __init__(self, offsets=()):
+        # 팔로워 구성이 바뀔 때만 새로 만든다. distance 에 대한 삼각함수는 여기서 미리 계산해 둔다
+        distances = np.array([distance for distance, _ in offsets], dtype=float)
+        angular = distances / EARTH_RADIUS_M
+        self._angles = np.radians(np.array([angle for _, angle in offsets], dtype=float))
+        self._sinDistance = np.sin(angular)
+        self._cosDistance = np.cos(angular)
+
+    def __len__(self):
+        return len(self._angles)
+
+    def solve(self, leader_latitude, leader_longitude, leader_heading):
+        # inverse haversine 을 모든 팔로워에 대해 한 번에 계산한다
+        lat = math.radians(leader_latitude)
+        lon = math.radians(leader_longitude)
+        bearing = math.radians(leader_heading) + self._angles
+
+        sinLat = math.sin(lat)
+        cosLat = math.cos(lat)
+        follower_lat = np.arcsin(sinLat * self._cosDistance + cosLat * self._sinDistance * np.cos(bearing))
+        follower_lon = lon + np.arctan2(np.sin(bearing) * self._sinDistance * cosLat,
+                                        self._cosDistance - sinLat * np.sin(follower_lat))
+
+        return np.degrees(follower_lat), np.degrees(follower_lon)
@@ -0,0 +1,78 @@
+import sys
+import logging
+import argparse
+import multiprocessing
+import asyncio
+import signal
+
+from mainController import MainController
+from commandBridge import CommandBridge
+from commandRegistry import CommandRegistry
+from asyncSocketServer import AsyncSocketServer
+from serverCore import ServerCore
+from serverPool import ServerPool
+import droneShard
+
+logger = logging.getLogger()
+
+# closeServer 이후 드론 cleanup 을 기다리는 시간. main.py 의 closeApp 과 같다
+CLOSE_DELAY = 3.0
+
+
+async def run(args):
+    # 서버, 명령 lane, 드론, swarm 이 모두 이 loop 하나에서 돈다
+    bridge = CommandBridge()
+    bridgeTask = asyncio.ensure_future(bridge.run())
+
+    shardPool = None
+    if args.shards > 0:
+        shardPool = droneShard.ShardPool(args.shards)
+        shardPool.start()
+
+    try:
+        controller = MainController(bridge, shardPool)
+        server = AsyncSocketServer.getInstance()
+        controller.registerCommands(CommandRegistry.getInstance())
+        controller.setReplySink(server.sendReply)
+        await server.start_server(args.host, args.port)
+
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, server._closeServer)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        await server.closed.wait()
+        controller.closeServer()
+        await asyncio.sleep(CLOSE_DELAY)
+    finally:
+        bridge.put('finish')
+        await bridgeTask
+        await ServerPool.getInstance().close()
+        if shardPool:
+            shardPool.stop()
+
+
+if __name__ == "__main__":
+    # spawn 으로 만든 shard 프로세스가 PyInstaller exe 에서 main 을 다시 실행하지 않도록 가장 먼저 호출한다
+    multiprocessing.freeze_support()
+
+    rootLogger = logging.getLogger()
+    rootLogger.setLevel(logging.DEBUG)
+    rootLogger.propagate = 0
+    formatter = logging.Formatter('[%(asctime)s][%(levelname)s][%(thread)d][%(filename)s:%(funcName)s:%(lineno)d]'
+                                  ' %(message)s')
+    streamHandler = logging.StreamHandler()
+    streamHandler.setFormatter(formatter)
+    rootLogger.addHandler(streamHandler)
+
+    parser = argparse.ArgumentParser(description='mavsdk service without Qt')
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--port', type=int, default=ServerCore.PORT)
+    parser.add_argument('--shards', type=int, default=0,
+                        help='run drones in this many worker processes (0: in the main process)')
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+    sys.exit(0)
@@ -4,12 +4,18 @@ from PyQt5.QtWidgets import QApplication
 import sys
 import logging
 import atexit
+import argparse
+import multiprocessing
 
 import mainController
+import droneProxy
 import asyncThread
 import socketServer
+import commandRegistry
+import droneShard
 
 logger = logging.getLogger()
+shardPool = None
 
 
 class WindowManager(QObject):
@@ -52,9 +58,14 @@ def _handleQmlWarnings(warnings):
 
 def exit_handler():
     logger.debug('')
+    if shardPool:
+        shardPool.stop()
 
 
 if __name__ == "__main__":
+    # spawn 으로 만든 shard 프로세스가 PyInstaller exe 에서 main 을 다시 실행하지 않도록 가장 먼저 호출한다
+    multiprocessing.freeze_support()
+
     rootLogger = logging.getLogger()
     rootLogger.setLevel(logging.DEBUG)
     rootLogger.propagate = 0
@@ -64,29 +75,26 @@ if __name__ == "__main__":
     streamHandler.setFormatter(formatter)
     rootLogger.addHandler(streamHandler)
 
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shards', type=int, default=0,
+                        help='run drones in this many worker processes (0: in the main process)')
+    args, qtArgs = parser.parse_known_args()
+
+    app = QApplication(sys.argv[:1] + qtArgs)
+
+    if args.shards > 0:
+        shardPool = droneShard.ShardPool(args.shards)
+        shardPool.start()
 
-    mainController = mainController.MainController(app)
+    mainController = mainController.MainController(asyncThread.AsyncThread.getInstance(), shardPool,
+                                                  droneProxy.DroneProxy)
 
     asyncThread.AsyncThread().getInstance().start()
 
     socketServer.SocketServer.getInstance().start_server()
-    socketServer.SocketServer.getInstance().connect.connect(mainController.connect)
-    socketServer.SocketServer.getInstance().setLeaderDrone.connect(mainController.setLeaderDrone)
-    socketServer.SocketServer.getInstance().addFollowerDrone.connect(mainController.addFollowerDrone)
-    socketServer.SocketServer.getInstance().removeFollowerDrone.connect(mainController.removeFollowerDrone)
-    socketServer.SocketServer.getInstance().readyToFollow.connect(mainController.readyToFollow)
-    socketServer.SocketServer.getInstance().followLeader.connect(mainController.followLeader)
-    socketServer.SocketServer.getInstance().stopFollow.connect(mainController.stopFollow)
-    socketServer.SocketServer.getInstance().setFollowFrequency.connect(mainController.setFollowFrequency)
-    socketServer.SocketServer.getInstance().arm.connect(mainController.arm)
-    socketServer.SocketServer.getInstance().startOffboardMode.connect(mainController.startOffboardMode)
-    socketServer.SocketServer.getInstance().stopOffboardMode.connect(mainController.stopOffboardMode)
-    socketServer.SocketServer.getInstance().setVelocityBody.connect(mainController.setVelocityBody)
-    socketServer.SocketServer.getInstance().setVelocityNED.connect(mainController.setVelocityNED)
-    socketServer.SocketServer.getInstance().setAttitude.connect(mainController.setAttitude)
-    socketServer.SocketServer.getInstance().setPositionNED.connect(mainController.setPositionNED)
+    mainController.registerCommands(commandRegistry.CommandRegistry.getInstance())
     socketServer.SocketServer.getInstance().closeServer.connect(mainController.closeServer)
+    mainController.setReplySink(socketServer.SocketServer.getInstance().sendReply)
 
     wm = WindowManager(app)
     wm.app = app
@@ -1,105 +1,361 @@
-from PyQt5.QtCore import QObject, pyqtSlot, pyqtProperty, pyqtSignal, QVariant
 import logging
 import asyncio
 
-from droneProxy import DroneProxy
-from asyncThread import AsyncThread
+from droneCore import DroneCore
+from droneRegistry import DroneRegistry
+from commandBridge import CommandBridge
 from swarmManager import SwarmManager
+from telemetryFilter import TelemetryFilter
+from droneState import VersionClock
+from serverPool import ServerPool
+from setpointPump import SetpointPump
+from commandRegistry import DRONE_INDEX, CommandError
 
 logger = logging.getLogger()
 
 
-class MainController(QObject):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self._drones = [DroneProxy(), DroneProxy(port="50052", index=1), DroneProxy(port="50053", index=2), DroneProxy(port="50054", index=3)]
+class MainController:
+    def __init__(self, bridge, shardPool=None, droneFactory=DroneCore):
+        # 명령은 bridge 의 lane 에서 실행한다. Qt 에서는 AsyncThread, headless 에서는 같은 loop 의 CommandBridge
+        self._bridge = bridge
+        # shardPool 이 있으면 드론은 worker 프로세스에서 돌고 여기에는 RemoteDrone 만 둔다
+        self._shardPool = shardPool
+        self._drones = DroneRegistry(shardPool.createDrone if shardPool else droneFactory)
+        # 연결 해제된 드론 index -> 해제한 version. getState 의 변경분 조회에서 알려준다
+        self._removed = dict()
+        # lane 에서 끝난 명령의 결과를 client 에게 보내는 함수. (client, func, result)
+        self._replySink = None
+
+    def registerCommands(self, registry):
+        registry.setDroneCount(lambda: self._drones.maxDrones)
+        registry.register('connect', self.connect, (DRONE_INDEX, str, str))
+        registry.register('disconnect', self.disconnectDrone, (DRONE_INDEX,))
+        registry.register('getDrones', self.getDrones)
+        registry.register('getState', self.getState, (int,), defaults=(0,))
+        registry.register('resolveSystemId', self.resolveSystemId, (int,))
+        registry.register('setLeaderDrone', self.setLeaderDrone, (DRONE_INDEX, int), withClient=True, defaults=(0,))
+        registry.register('addFollowerDrone', self.addFollowerDrone, (DRONE_INDEX, float, float, int), withClient=True, defaults=(0,))
+        registry.register('removeFollowerDrone', self.removeFollowerDrone, (DRONE_INDEX, int), withClient=True, defaults=(0,))
+        registry.register('readyToFollow', self.readyToFollow, (int,), withClient=True, defaults=(0,))
+        registry.register('setReadyBarrier', self.setReadyBarrier, (str, float, int), withClient=True, defaults=(0.5, 0))
+        registry.register('followLeader', self.followLeader, (float, int), withClient=True, defaults=(0,))
+        registry.register('stopFollow', self.stopFollow, (int,), withClient=True, defaults=(0,))
+        registry.register('setFollowFrequency', self.setFollowFrequency, (float, int), withClient=True, defaults=(0,))
+        registry.register('arm', self.arm, (DRONE_INDEX,))
+        registry.register('startOffboardMode', self.startOffboardMode, (DRONE_INDEX,))
+        registry.register('stopOffboardMode', self.stopOffboardMode, (DRONE_INDEX,))
+        registry.register('setVelocityBody', self.setVelocityBody, (DRONE_INDEX, float, float, float, float))
+        registry.register('setVelocityNED', self.setVelocityNED, (DRONE_INDEX, float, float, float, float))
+        registry.register('setAttitude', self.setAttitude, (DRONE_INDEX, float, float, float, float))
+        registry.register('setPositionNED', self.setPositionNED, (DRONE_INDEX, float, float, float, float))
+        registry.register('setFollowOverrunPolicy', self.setFollowOverrunPolicy, (str,), withClient=True)
+        registry.register('setLeadCompensation', self.setLeadCompensation, (bool, float, int), withClient=True, defaults=(0,))
+        registry.register('getFollowStats', self.getFollowStats, (int,), defaults=(0,))
+        registry.register('getLaneStats', self.getLaneStats)
+        registry.register('getShardStats', self.getShardStats)
+        registry.register('setTelemetryFilter', self.setTelemetryFilter, (bool, float))
+        registry.register('setTelemetryDeadband', self.setTelemetryDeadband, (str, float))
+        registry.register('getTelemetryFilterStats', self.getTelemetryFilterStats)
+        registry.register('warmServers', self.warmServers, (str, str))
+        registry.register('getServerPoolStats', self.getServerPoolStats)
+        registry.register('setSetpointRate', self.setSetpointRate, (float,))
+        registry.register('getSetpointPumpStats', self.getSetpointPumpStats)
+        registry.register('createSwarm', self.createSwarm, withClient=True)
+        registry.register('removeSwarm', self.removeSwarm, (int,), withClient=True)
+        registry.register('getSwarms', self.getSwarms, withClient=True)
 
     def cleanup(self):
-        for drone in self._drones:
-            AsyncThread.getInstance().put((drone.cleanup, ()))
+        for drone in self._drones.drones():
+            self._bridge.put((drone.cleanup, ()), drone.index)
+
+    def _drone(self, index):
+        drone = self._drones.get(index)
+        if drone is None:
+            raise CommandError(f'drone {index} is not connected')
+        return drone
 
-    @pyqtSlot(int, str, str)
     def connect(self, index, ip, port):
         logger.debug(f'index:{index}, ip:{ip}, port:{port}')
-        AsyncThread.getInstance().put((self._connect_async, (index, ip, port)))
+        drone = self._drones.getOrCreate(index)
+        self._removed.pop(index, None)
+        self._bridge.put((self._connect_async, (drone, ip, port)), index)
+
+    async def _connect_async(self, drone, ip, port):
+        logger.debug('')
+        # 연결 state machine 을 시작만 하고 돌아오므로 이 드론의 lane 이 막히지 않는다
+        await drone.connect(f"udp://{ip}:{port}")
+
+    def disconnectDrone(self, index):
+        logger.debug(f'index:{index}')
+        drone = self._drones.detach(index)
+        if drone is None:
+            raise CommandError(f'drone {index} is not connected')
+        self._bridge.call(lambda: SwarmManager.getInstance().removeDrone(drone))
+        with VersionClock.getInstance() as version:
+            self._removed[index] = version
+        self._bridge.put((self._disconnect_async, (drone,)), index)
+
+    async def _disconnect_async(self, drone):
+        logger.debug('')
+        await drone.cleanup()
+
+    def getDrones(self):
+        return [{'index': drone.index, 'serverPort': drone.serverPort, 'systemId': drone.systemId, 'connected': drone.isConnected}
+                for drone in self._drones.drones()]
+
+    def getState(self, sinceVersion):
+        # 드론 상태는 event loop 스레드에서 바뀌므로 loop 스레드에서 한 번에 모아서 같은 시점의 snapshot 을 만든다
+        if sinceVersion < 0:
+            raise CommandError(f'getState: sinceVersion must not be negative, got {sinceVersion}')
+        return self._bridge.call(lambda: self._collectState(sinceVersion))
+
+    def _collectState(self, sinceVersion):
+        # version 을 먼저 읽어야 이 version 이하의 변경은 모두 이번 snapshot 에 들어간다. sinceVersion 0 은 전체
+        manager = SwarmManager.getInstance()
+        version = VersionClock.getInstance().version
+        drones = [drone.snapshot() for drone in self._drones.drones()]
+        # 'swarm' 은 구버전 client 를 위한 기본 swarm(0) 이고, 'swarms' 에 모든 swarm 이 들어간다
+        swarm = manager.swarm(SwarmManager.DEFAULT_SWARM).snapshot()
+        if sinceVersion == 0:
+            return {'version': version, 'since': 0, 'drones': drones, 'removed': [], 'swarm': swarm,
+                    'swarms': manager.snapshots(), 'removedSwarms': []}
+        return {'version': version,
+                'since': sinceVersion,
+                'drones': [snapshot for snapshot in drones if snapshot['version'] > sinceVersion],
+                'removed': [index for index, removed in list(self._removed.items()) if removed > sinceVersion],
+                'swarm': swarm if swarm['version'] > sinceVersion else None,
+                'swarms': manager.snapshots(sinceVersion),
+                'removedSwarms': manager.removedSince(sinceVersion)}
+
+    def resolveSystemId(self, systemId):
+        drone = self._drones.bySystemId(systemId)
+        if drone is None:
+            raise CommandError(f'no drone with system id {systemId}')
+        return drone.index
+
+    def _swarm(self, swarmId):
+        try:
+            return SwarmManager.getInstance().swarm(swarmId)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def _putSwarmCommand(self, client, func, lane, handler, args=()):
+        # Qt 스레드를 막지 않도록 swarm 을 바꾸는 명령은 lane 에서 실행하고, 결과나 오류는 replySink 로 보낸다
+        self._bridge.put((self._swarmCommand_async, (client, func, handler, args)), lane)
+
+    async def _swarmCommand_async(self, client, func, handler, args):
+        # client 는 명령마다 결과나 오류를 하나씩 받는다. 돌려줄 값이 없는 명령은 true 로 끝났음을 알린다
+        try:
+            result = handler(*args)
+            if asyncio.iscoroutine(result):
+                result = await result
+        except ValueError as e:
+            # 잘못된 값이거나 lane 에서 기다리는 사이에 swarm 이 삭제되었다
+            self._reply(client, func, None, str(e))
+            return
+        except Exception as e:
+            logger.exception(f'{func} failed')
+            self._reply(client, func, None, repr(e))
+            return
+        self._reply(client, func, True if result is None else result)
+
+    def _reply(self, client, func, result, error=None):
+        if self._replySink:
+            self._replySink(client, func, result, error)
+
+    def createSwarm(self, client):
+        logger.debug('')
+        self._putSwarmCommand(client, 'createSwarm', CommandBridge.SWARM_LANE, SwarmManager.getInstance().createSwarm)
+
+    def removeSwarm(self, client, swarmId):
+        logger.debug(f'swarmId: {swarmId}')
+        self._swarm(swarmId)
+        self._putSwarmCommand(client, 'removeSwarm', CommandBridge.swarmLane(swarmId), self._removeSwarm, (swarmId,))
+
+    def _removeSwarm(self, swarmId):
+        SwarmManager.getInstance().removeSwarm(swarmId)
+        # 이미 들어온 명령을 마친 뒤 삭제된 swarm 의 lane 도 끝낸다
+        self._bridge.closeLane(CommandBridge.swarmLane(swarmId))
 
-    async def _connect_async(self, index, ip, port):
+    def getSwarms(self, client):
+        self._putSwarmCommand(client, 'getSwarms', CommandBridge.SWARM_LANE, SwarmManager.getInstance().snapshots)
+
+    # swarm 구성은 loop 스레드에서 follow tick 과 createSwarm / removeSwarm 이 읽고 바꾸므로 swarm lane 에서만 바꾼다
+    def setLeaderDrone(self, client, index, swarmId):
         logger.debug('')
-        await self._drones[index].connect(f"udp://{ip}:{port}")
+        self._swarm(swarmId)
+        self._putSwarmCommand(client, 'setLeaderDrone', CommandBridge.swarmLane(swarmId),
+                              SwarmManager.getInstance().setLeader, (swarmId, self._drone(index)))
 
-    @pyqtSlot(int)
-    def setLeaderDrone(self, index):
+    def addFollowerDrone(self, client, index, distance, angle, swarmId):
         logger.debug('')
-        SwarmManager.getInstance().setLeader(self._drones[index])
+        self._swarm(swarmId)
+        self._putSwarmCommand(client, 'addFollowerDrone', CommandBridge.swarmLane(swarmId),
+                              SwarmManager.getInstance().addFollower, (swarmId, self._drone(index), distance, angle))
 
-    @pyqtSlot(int, float, float)
-    def addFollowerDrone(self, index, distance, angle):
+    def removeFollowerDrone(self, client, index, swarmId):
         logger.debug('')
-        SwarmManager.getInstance().addFollower(self._drones[index], distance, angle)
+        self._swarm(swarmId)
+        self._putSwarmCommand(client, 'removeFollowerDrone', CommandBridge.swarmLane(swarmId),
+                              SwarmManager.getInstance().removeFollower, (swarmId, self._drone(index)))
+
+    def setReplySink(self, replySink):
+        self._replySink = replySink
+
+    def readyToFollow(self, client, swarmId):
+        # 결과는 모든 팔로워가 끝난 뒤 reply 로 한 번 보낸다
+        logger.debug('')
+        self._swarm(swarmId)
+        self._bridge.put((self._readyToFollow_async, (client, swarmId)), CommandBridge.swarmLane(swarmId))
+
+    async def _readyToFollow_async(self, client, swarmId):
+        try:
+            result = await SwarmManager.getInstance().readyToFollow(swarmId)
+        except ValueError as e:
+            # lane 에서 기다리는 사이에 swarm 이 삭제되었다
+            result = {'swarmId': swarmId, 'passed': False, 'error': str(e)}
+        self._reply(client, 'readyToFollow', result)
 
-    @pyqtSlot(int)
-    def removeFollowerDrone(self, index):
+    def setReadyBarrier(self, client, barrier, quorum, swarmId):
+        self._swarm(swarmId)
+        self._putSwarmCommand(client, 'setReadyBarrier', CommandBridge.swarmLane(swarmId),
+                              SwarmManager.getInstance().setReadyBarrier, (swarmId, barrier, quorum))
+
+    def followLeader(self, client, frequency, swarmId):
         logger.debug('')
-        SwarmManager.getInstance().removeFollower(self._drones[index])
+        if frequency <= 0:
+            raise CommandError(f'followLeader: frequency must be positive, got {frequency}')
+        self._swarm(swarmId)
+        # scheduler 는 loop 스레드에서만 바꾼다
+        self._putSwarmCommand(client, 'followLeader', CommandBridge.swarmLane(swarmId), self._followLeader_async,
+                              (swarmId, frequency))
+
+    async def _followLeader_async(self, swarmId, frequency):
+        manager = SwarmManager.getInstance()
+        manager.setFollowFrequency(swarmId, frequency)
+        await manager.runTaskFollow(swarmId)
 
-    @pyqtSlot()
-    def readyToFollow(self):
+    def stopFollow(self, client, swarmId):
         logger.debug('')
-        AsyncThread.getInstance().put((SwarmManager.getInstance().readyToFollow, ()))
+        self._swarm(swarmId)
+        self._putSwarmCommand(client, 'stopFollow', CommandBridge.swarmLane(swarmId),
+                              SwarmManager.getInstance().stopFollow, (swarmId,))
 
-    @pyqtSlot(float)
-    def followLeader(self, frequency):
+    def setFollowFrequency(self, client, frequency, swarmId):
         logger.debug('')
-        SwarmManager.getInstance().followFrequency = frequency
-        AsyncThread.getInstance().put((SwarmManager.getInstance().runTaskFollow, ()))
+        if frequency <= 0:
+            raise CommandError(f'setFollowFrequency: frequency must be positive, got {frequency}')
+        self._swarm(swarmId)
+        self._putSwarmCommand(client, 'setFollowFrequency', CommandBridge.swarmLane(swarmId),
+                              SwarmManager.getInstance().setFollowFrequency, (swarmId, frequency))
 
-    @pyqtSlot()
-    def stopFollow(self):
+    def setFollowOverrunPolicy(self, client, policy):
         logger.debug('')
-        SwarmManager.getInstance().stopFollow()
+        # scheduler 는 모든 swarm 이 함께 쓰므로 swarm 목록을 바꾸는 lane 에서 바꾼다
+        self._putSwarmCommand(client, 'setFollowOverrunPolicy', CommandBridge.SWARM_LANE,
+                              self._setFollowOverrunPolicy, (policy,))
+
+    def _setFollowOverrunPolicy(self, policy):
+        SwarmManager.getInstance().overrunPolicy = policy
 
-    @pyqtSlot(float)
-    def setFollowFrequency(self, frequency):
+    def setLeadCompensation(self, client, enabled, commandLatency, swarmId):
         logger.debug('')
-        SwarmManager.getInstance().followFrequency = frequency
+        if commandLatency < 0:
+            raise CommandError(f'setLeadCompensation: commandLatency must not be negative, got {commandLatency}')
+        self._swarm(swarmId)
+        self._putSwarmCommand(client, 'setLeadCompensation', CommandBridge.swarmLane(swarmId),
+                              SwarmManager.getInstance().setLeadCompensation, (swarmId, enabled, commandLatency))
+
+    def getFollowStats(self, swarmId):
+        self._swarm(swarmId)
+        return self._bridge.call(lambda: SwarmManager.getInstance().followStats(swarmId))
 
-    @pyqtSlot(int)
     def arm(self, index):
         logger.debug('')
-        AsyncThread.getInstance().put((self._drones[index].arm, ()))
+        self._bridge.put((self._drone(index).arm, ()), index)
 
-    @pyqtSlot(int)
     def startOffboardMode(self, index):
         logger.debug('')
-        AsyncThread.getInstance().put((self._drones[index].start_offboard_mode, ()))
+        self._bridge.put((self._drone(index).start_offboard_mode, ()), index)
 
-    @pyqtSlot(int)
     def stopOffboardMode(self, index):
         logger.debug('')
-        AsyncThread.getInstance().put((self._drones[index].stop_offboard_mode, ()))
+        self._bridge.put((self._drone(index).stop_offboard_mode, ()), index)
 
-    @pyqtSlot(int, float, float, float, float)
     def setVelocityBody(self, index, forward, right, down, yaw):
         logger.debug('')
-        AsyncThread.getInstance().put((self._drones[index].set_velocity_body, (forward, right, down, yaw)))
+        self._bridge.put((self._drone(index).set_velocity_body, (forward, right, down, yaw)), index, 'setVelocityBody')
 
-    @pyqtSlot(int, float, float, float, float)
     def setVelocityNED(self, index, north, east, down, yaw):
         logger.debug('')
-        AsyncThread.getInstance().put((self._drones[index].set_velocity_ned, (north, east, down, yaw)))
+        self._bridge.put((self._drone(index).set_velocity_ned, (north, east, down, yaw)), index, 'setVelocityNED')
 
-    @pyqtSlot(int, float, float, float, float)
     def setAttitude(self, index, roll, pitch, yaw, thrust):
         logger.debug('')
-        AsyncThread.getInstance().put((self._drones[index].set_attitude, (roll, pitch, yaw, thrust)))
+        self._bridge.put((self._drone(index).set_attitude, (roll, pitch, yaw, thrust)), index, 'setAttitude')
 
-    @pyqtSlot(int, float, float, float, float)
     def setPositionNED(self, index, north, east, down, yaw):
         logger.debug('')
-        AsyncThread.getInstance().put((self._drones[index].set_position_ned, (north, east, down, yaw)))
+        self._bridge.put((self._drone(index).set_position_ned, (north, east, down, yaw)), index, 'setPositionNED')
+
+    def getLaneStats(self):
+        return self._bridge.stats()
+
+    def getShardStats(self):
+        return self._shardPool.stats() if self._shardPool else []
+
+    def setTelemetryFilter(self, enabled, keyframeInterval):
+        logger.debug(f'enabled: {enabled}, keyframeInterval: {keyframeInterval}')
+        TelemetryFilter.getInstance().enabled = enabled
+        TelemetryFilter.getInstance().keyframeInterval = keyframeInterval
+        self._configureShardFilters()
+
+    def setTelemetryDeadband(self, field, value):
+        logger.debug(f'field: {field}, value: {value}')
+        try:
+            TelemetryFilter.getInstance().setDeadband(field, value)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self._configureShardFilters()
+
+    def getTelemetryFilterStats(self):
+        return TelemetryFilter.getInstance().stats()
+
+    def warmServers(self, ip, port):
+        # connect 와 같은 주소로 mavsdk_server 를 미리 띄워 둔다. 주소 하나에 server 하나
+        logger.debug(f'ip:{ip}, port:{port}')
+        if self._shardPool:
+            raise CommandError('warmServers: mavsdk_server runs in the shard workers')
+        self._bridge.put((ServerPool.getInstance().warm, (f"udp://{ip}:{port}",)))
+
+    def getServerPoolStats(self):
+        if self._shardPool:
+            raise CommandError('getServerPoolStats: mavsdk_server runs in the shard workers')
+        return self._bridge.call(ServerPool.getInstance().stats)
+
+    def setSetpointRate(self, rate):
+        # offboard 중인 드론에 마지막 setpoint 를 다시 보내는 주기. 다음 tick 부터 적용된다
+        logger.debug(f'rate: {rate}')
+        try:
+            SetpointPump.getInstance().rate = rate
+        except ValueError as e:
+            raise CommandError(str(e))
+        if self._shardPool:
+            self._shardPool.configureSetpointRate(rate)
+
+    def getSetpointPumpStats(self):
+        if self._shardPool:
+            raise CommandError('getSetpointPumpStats: setpoints are sent from the shard workers')
+        return self._bridge.call(SetpointPump.getInstance().stats)
+
+    def _configureShardFilters(self):
+        # shard 를 쓰면 filter 는 worker 프로세스에서 동작하므로 설정을 복사해 보낸다
+        if self._shardPool:
+            telemetryFilter = TelemetryFilter.getInstance()
+            self._shardPool.configureFilter(telemetryFilter.enabled, telemetryFilter.keyframeInterval,
+                                            telemetryFilter.deadbands())
 
-    @pyqtSlot()
     def closeServer(self):
         logger.debug('')
         self.cleanup()
-        # AsyncThread.getInstance().put('finish')
+        # self._bridge.put('finish')
@@ -0,0 +1,118 @@
+import logging
+import struct
+
+logger = logging.getLogger()
+
+
+class FrameBuffer:
+    DELIMITER = b'\n'
+
+    def __init__(self, maxFrameSize=65536):
+        self._buffer = bytearray()
+        self._maxFrameSize = maxFrameSize
+        self._discarding = False
+        self.oversized = 0
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    def feed(self, data):
+        # 완성된 frame 들을 모두 반환하고 마지막 미완성 조각은 다음 read 를 위해 남겨둔다
+        if self._discarding:
+            index = data.find(self.DELIMITER)
+            if index < 0:
+                return []
+            data = data[index + 1:]
+            self._discarding = False
+
+        self._buffer += data
+        if self.DELIMITER not in data:
+            self._checkTail()
+            return []
+
+        frames = self._buffer.split(self.DELIMITER)
+        self._buffer = frames.pop()
+        self._checkTail()
+
+        result = list()
+        for frame in frames:
+            if len(frame) > self._maxFrameSize:
+                self.oversized += 1
+                logger.debug(f'drop oversized frame: {len(frame)} bytes')
+                continue
+            if frame.strip():
+                result.append(bytes(frame))
+        return result
+
+    @property
+    def tail(self):
+        return bytes(self._buffer)
+
+    def clear(self):
+        self._buffer = bytearray()
+        self._discarding = False
+
+    def _checkTail(self):
+        if len(self._buffer) > self._maxFrameSize:
+            self.oversized += 1
+            logger.debug(f'drop oversized partial frame: {len(self._buffer)} bytes')
+            self._buffer = bytearray()
+            self._discarding = True
+
+
+class LengthPrefixedFrameBuffer:
+    # getState 같은 큰 reply 도 담을 수 있도록 길이는 u32. 받는 쪽은 maxFrameSize 보다 긴 frame 을 읽지 않고 건너뛴다
+    HEADER = struct.Struct('<I')
+
+    def __init__(self, maxFrameSize=65536):
+        self._buffer = bytearray()
+        self._maxFrameSize = maxFrameSize
+        self._skip = 0
+        self.oversized = 0
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    @property
+    def tail(self):
+        return bytes(self._buffer)
+
+    def clear(self):
+        self._buffer = bytearray()
+        self._skip = 0
+
+    def feed(self, data):
+        if self._skip:
+            skipped = min(self._skip, len(data))
+            self._skip -= skipped
+            data = data[skipped:]
+        self._buffer += data
+
+        result = list()
+        offset = 0
+        size = len(self._buffer)
+        header = self.HEADER.size
+        while size - offset >= header:
+            length, = self.HEADER.unpack_from(self._buffer, offset)
+            start = offset + header
+            if length > self._maxFrameSize:
+                self.oversized += 1
+                logger.debug(f'drop oversized frame: {length} bytes')
+                skipped = min(length, size - start)
+                self._skip = length - skipped
+                offset = start + skipped
+                continue
+            if size - start < length:
+                break
+            result.append(bytes(self._buffer[start:start + length]))
+            offset = start + length
+
+        if offset:
+            del self._buffer[:offset]
+        return result
+
+    @classmethod
+    def frame(cls, payload):
+        return cls.HEADER.pack(len(payload)) + payload
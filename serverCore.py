@@ -0,0 +1,213 @@
+import logging
+import json
+import struct
+
+from commandRegistry import CommandRegistry, CommandError
+from wireProtocol import JsonCodec, BinaryCodec, DeltaCodec
+from clientChannel import ClientChannel
+from telemetryAggregator import TelemetryAggregator
+
+logger = logging.getLogger()
+
+
+class ServerCore:
+    # client 관리, 명령 처리, telemetry 전송. socket 과 timer 는 SocketServer(Qt) 와 AsyncSocketServer(asyncio) 가 제공한다
+    PORT = 12345
+
+    def __init__(self, startFrameTimer, stopFrameTimer, sendReply):
+        # frame timer 와 스레드 전환은 SocketServer / AsyncSocketServer 가 넘겨준다
+        self._startFrameTimer = startFrameTimer
+        self._stopFrameTimer = stopFrameTimer
+        # sendReply(client, func, result, error=None): lane 에서 끝난 명령의 결과나 오류를 요청한 client 에게 보낸다.
+        # 어느 스레드에서 불러도 된다
+        self.sendReply = sendReply
+        self.clients = []
+        self._channels = dict()
+        self._codecs = {codec.name: codec for codec in (JsonCodec(), BinaryCodec(CommandRegistry.getInstance()),
+                                                        DeltaCodec(CommandRegistry.getInstance()))}
+
+        CommandRegistry.getInstance().register('closeServer', self._closeServer)
+        CommandRegistry.getInstance().register('setProtocol', self._setProtocol, (str,), withClient=True)
+        CommandRegistry.getInstance().register('setTelemetryRate', self.setTelemetryRate, (float,))
+        CommandRegistry.getInstance().register('getClientStats', self.clientStats)
+        CommandRegistry.getInstance().register('subscribe', self._subscribe, (list, list, float), withClient=True)
+        CommandRegistry.getInstance().register('ackTelemetry', self._ackTelemetry, (int,), withClient=True)
+
+    def _abort(self, client_socket):
+        # QTcpSocket 과 asyncio 쪽 _Connection 모두 abort 를 제공한다
+        client_socket.abort()
+
+    def _serverClosed(self):
+        pass
+
+    def _sendReply(self, client_socket, func, result, error=None):
+        # 그 사이에 연결이 끊긴 client 는 send_to 가 무시한다
+        if error is not None:
+            self.send_to(client_socket, "error", {"func": func, "message": error})
+            return
+        self.send_to(client_socket, "reply", {"func": func, "result": result})
+
+    def close(self):
+        self._stopFrameTimer()
+
+    def setTelemetryRate(self, rate):
+        logger.debug(f'rate: {rate}')
+        TelemetryAggregator.getInstance().rate = rate
+        if rate > 0:
+            self._startFrameTimer(1 / rate)
+        else:
+            self._stopFrameTimer()
+            TelemetryAggregator.getInstance().flush()
+
+    def _add_client(self, client_socket, peer):
+        self.clients.append(client_socket)
+        self._channels[client_socket] = ClientChannel(client_socket, self._codecs['json'], peer)
+        logger.debug(f"New connection: {peer}")
+
+    def _remove_client(self, client_socket):
+        channel = self._channels.pop(client_socket, None)
+        if channel is None:
+            return None
+        if client_socket in self.clients:
+            self.clients.remove(client_socket)
+        logger.debug(f"Client removed: {channel.peer}")
+        return channel
+
+    def _pump(self, client_socket):
+        channel = self._channels.get(client_socket)
+        if channel is None:
+            return
+        channel.pump()
+        if channel.overloaded:
+            logger.debug(f"Disconnect slow client: {channel.peer}")
+            self._remove_client(client_socket)
+            self._abort(client_socket)
+
+    def _subscribe(self, client_socket, drones, types, maxRate):
+        logger.debug(f'drones: {drones}, types: {types}, maxRate: {maxRate}')
+        if not all(isinstance(index, int) for index in drones):
+            raise CommandError('subscribe: drones must be a list of drone indices')
+        if not all(isinstance(msgType, str) for msgType in types):
+            raise CommandError('subscribe: types must be a list of message types')
+        self._channels[client_socket].subscribe(drones, types, maxRate)
+
+    def _ackTelemetry(self, client_socket, seq):
+        stream = self._channels[client_socket].stream
+        if stream is None:
+            raise CommandError('ackTelemetry: current protocol has no telemetry stream')
+        stream.ack(seq)
+
+    def clientStats(self):
+        return [channel.stats() for channel in list(self._channels.values())]
+
+    def receive_data(self, client_socket, data):
+        channel = self._channels.get(client_socket)
+        if channel is None:
+            return
+
+        buffer = channel.framer
+        frames = buffer.feed(data)
+
+        # 구버전 클라이언트는 개행 없이 JSON 하나를 보내므로 남은 조각이 완전한 JSON 이면 처리한다
+        if not frames and channel.codec.name == 'json' and buffer.tail.endswith(b'}'):
+            try:
+                data = json.loads(buffer.tail)
+            except ValueError:
+                return
+            buffer.clear()
+            self._handle_message(client_socket, data)
+            return
+
+        for frame in frames:
+            # setProtocol 이후에는 codec 이 바뀌므로 frame 마다 현재 codec 으로 decode 한다
+            try:
+                data = channel.codec.decode(frame)
+            except (ValueError, CommandError) as e:
+                logger.debug(f"Invalid message from client: {e}")
+                self.send_to(client_socket, "error", {"func": None, "message": str(e)})
+                continue
+            self._handle_message(client_socket, data)
+
+    def _handle_message(self, client_socket, data):
+        logger.debug(f"Received from client: {data}")
+
+        if not isinstance(data, dict):
+            self.send_to(client_socket, "error", {"func": None, "message": "message must be an object"})
+            return
+
+        func = data.get('func')
+        try:
+            result = CommandRegistry.getInstance().dispatch(func, data.get('args', []), client_socket)
+        except CommandError as e:
+            logger.debug(f"Rejected message: {e}")
+            self.send_to(client_socket, "error", {"func": func, "message": str(e)})
+            return
+        except Exception as e:
+            logger.exception(f"{func} failed: {e}")
+            self.send_to(client_socket, "error", {"func": func, "message": str(e)})
+            return
+
+        if result is not None:
+            self.send_to(client_socket, "reply", {"func": func, "result": result})
+
+    def _setProtocol(self, client_socket, name):
+        codec = self._codecs.get(name)
+        if codec is None:
+            raise CommandError(f'unknown protocol: {name}, available: {list(self._codecs)}')
+
+        # 응답은 기존 protocol 로 보내고, 그 이후의 송수신부터 새 protocol 을 사용한다
+        reply = {"protocol": name}
+        if isinstance(codec, BinaryCodec):
+            reply.update(codec.describe())
+        self.send_to(client_socket, "reply", {"func": "setProtocol", "result": reply})
+        self._channels[client_socket].setCodec(codec)
+
+    def _closeServer(self):
+        self.close()
+        self._serverClosed()
+
+    def send_to(self, client, msgType, value):
+        channel = self._channels.get(client)
+        if channel is None:
+            return
+        try:
+            message = channel.codec.encode(msgType, value)
+        except (struct.error, TypeError, ValueError) as e:
+            # 보낼 수 없는 reply 가 receive_data 나 Qt slot 밖으로 나가지 않도록 client 에게 error 로 알린다
+            logger.exception(f"cannot encode {msgType}: {e}")
+            if msgType == "error":
+                return
+            func = value.get("func") if isinstance(value, dict) else None
+            message = channel.codec.encode("error", {"func": func, "message": f"cannot encode {msgType}: {e}"})
+        channel.enqueue(message)
+        self._pump(client)
+
+    def send_frame(self, items):
+        # 구독 조건이 없는 client 들은 codec 별로 한 번만 encode 하고, 구독한 client 나 delta stream 은 client 별로 encode 한다
+        messages = dict()
+        for client, channel in list(self._channels.items()):
+            if channel.subscribed or channel.stream is not None:
+                filtered = channel.filterFrame(items) if channel.subscribed else items
+                if not filtered:
+                    continue
+                message = channel.encodeFrame(filtered)
+                if message is None:
+                    continue
+            else:
+                message = messages.get(channel.codec.name)
+                if message is None:
+                    message = messages[channel.codec.name] = channel.codec.encodeFrame(items)
+            channel.enqueue(message, droppable=True)
+            self._pump(client)
+
+    def send_message(self, msgType, value):
+        # 같은 codec 을 쓰는 client 들에게는 한 번만 encode 한 message 를 보낸다
+        messages = dict()
+        for client, channel in list(self._channels.items()):
+            if not channel.accepts(msgType, value):
+                continue
+            message = messages.get(channel.codec.name)
+            if message is None:
+                message = messages[channel.codec.name] = channel.codec.encode(msgType, value)
+            channel.enqueue(message)
+            self._pump(client)
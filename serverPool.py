@@ -0,0 +1,252 @@
+import asyncio
+import atexit
+import logging
+import os
+import socket
+import subprocess
+import time
+
+logger = logging.getLogger()
+
+
+# mavsdk.System() 의 기본값. System 이 직접 띄울 때와 같은 MAVLink id 로 기체에 보인다
+MAVSDK_SYSID = 245
+MAVSDK_COMPID = 190
+
+
+def mavsdkServerCommand(address, port, sysid=MAVSDK_SYSID, compid=MAVSDK_COMPID):
+    # mavsdk.System 이 직접 띄울 때와 같은 mavsdk 패키지 안의 mavsdk_server 를 같은 인자로 쓴다
+    import mavsdk.bin
+    name = 'mavsdk_server.exe' if os.name == 'nt' else 'mavsdk_server'
+    command = [os.path.join(os.path.dirname(mavsdk.bin.__file__), name),
+               '-p', str(port), '--sysid', str(sysid), '--compid', str(compid)]
+    if address:
+        command.append(address)
+    return command
+
+
+def _freePort():
+    # shard worker 프로세스마다 pool 이 따로 있으므로 gRPC 포트는 OS 에서 비어 있는 포트를 받는다
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class _Backend:
+    def __init__(self, address, port, process):
+        self.address = address
+        self.port = port
+        self.process = process
+        self.idleSince = None
+        # mavsdk_server 는 기체를 찾은 뒤에야 gRPC 포트를 연다. 한 번 열린 뒤에는 포트가 닫히면 죽은 것으로 본다
+        self.ready = False
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+
+class ServerPool:
+    # 연결 주소별로 미리 띄워 둔 mavsdk_server. 드론은 connect 할 때 빌려 가고 cleanup 할 때 돌려준다
+    instance = None
+    MAX_SERVERS = 64
+    IDLE_TIMEOUT = 60.0
+    HEALTH_TIMEOUT = 0.5
+    STOP_TIMEOUT = 2.0
+    # 띄운 뒤 이 시간 안에 끝나면 포트를 bind 하지 못한 것으로 보고 새 포트로 다시 띄운다
+    SPAWN_CHECK = 0.05
+    SPAWN_ATTEMPTS = 3
+
+    def __init__(self, command=mavsdkServerCommand, maxServers=MAX_SERVERS, idleTimeout=IDLE_TIMEOUT):
+        self._command = command
+        self._maxServers = maxServers
+        self._idleTimeout = idleTimeout
+        self._idle = dict()
+        self._busy = set()
+        self._evictTask = None
+        self.spawned = 0
+        self.reused = 0
+        self.evicted = 0
+        # event loop 없이 프로세스가 끝나도 server 가 남지 않게 한다
+        atexit.register(self.shutdown)
+
+    @classmethod
+    def getInstance(cls):
+        if cls.instance is None:
+            cls.instance = ServerPool()
+        return cls.instance
+
+    @property
+    def maxServers(self):
+        return self._maxServers
+
+    @maxServers.setter
+    def maxServers(self, val):
+        self._maxServers = val
+
+    @property
+    def idleTimeout(self):
+        return self._idleTimeout
+
+    @idleTimeout.setter
+    def idleTimeout(self, val):
+        self._idleTimeout = val
+
+    def __len__(self):
+        return len(self._busy) + sum(len(backends) for backends in self._idle.values())
+
+    def stats(self):
+        return {'maxServers': self._maxServers,
+                'idleTimeout': self._idleTimeout,
+                'idle': {address: len(backends) for address, backends in self._idle.items() if backends},
+                'busy': len(self._busy),
+                'spawned': self.spawned,
+                'reused': self.reused,
+                'evicted': self.evicted}
+
+    async def warm(self, address):
+        # 미리 띄워 두면 connect 가 프로세스 spawn 과 기체 탐색을 기다리지 않는다.
+        # 한 주소의 UDP 포트는 server 하나만 bind 할 수 있으므로 이미 있는 주소는 띄우지 않는다
+        if self._idle.get(address) or any(backend.address == address for backend in self._busy):
+            return False
+        try:
+            backend = await self._spawn(address)
+        except (OSError, RuntimeError) as e:
+            logger.debug(f'warm {address} failed: {e}')
+            return False
+        self._putIdle(backend)
+        return True
+
+    async def waitReady(self, backend, timeout):
+        # gRPC 포트가 열릴 때까지 기다린다. System.connect 가 하는 것과 같다
+        deadline = time.monotonic() + timeout
+        while backend.alive and time.monotonic() < deadline:
+            if await self._healthy(backend) and backend.ready:
+                return True
+            await asyncio.sleep(0.01)
+        return False
+
+    async def checkout(self, address):
+        backends = self._idle.get(address)
+        while backends:
+            backend = backends.pop()
+            try:
+                healthy = await self._healthy(backend)
+            except asyncio.CancelledError:
+                self._putIdle(backend)
+                raise
+            if healthy:
+                self._busy.add(backend)
+                self.reused += 1
+                logger.debug(f'reuse mavsdk_server {address} on port {backend.port}')
+                return backend
+            logger.debug(f'mavsdk_server {address} on port {backend.port} is not healthy')
+            await self._stop(backend)
+
+        backend = await self._spawn(address)
+        self._busy.add(backend)
+        return backend
+
+    async def release(self, backend, healthy=True):
+        # 응답하지 않던 server 는 다시 빌려주지 않고 종료한다
+        self._busy.discard(backend)
+        if not healthy or not backend.alive:
+            await self._stop(backend)
+            return
+        self._putIdle(backend)
+
+    async def evictIdle(self, now=None):
+        now = time.monotonic() if now is None else now
+        expired = list()
+        for address, backends in self._idle.items():
+            expired += [backend for backend in backends if now - backend.idleSince >= self._idleTimeout]
+            backends[:] = [backend for backend in backends if now - backend.idleSince < self._idleTimeout]
+        self.evicted += len(expired)
+        await asyncio.gather(*[self._stop(backend) for backend in expired])
+        return len(expired)
+
+    async def close(self):
+        # 빌려준 것까지 모든 server 를 종료하고, 끝날 때까지 기다린다
+        if self._evictTask is not None:
+            self._evictTask.cancel()
+            self._evictTask = None
+        backends = list(self._busy) + [backend for backends in self._idle.values() for backend in backends]
+        self._busy.clear()
+        self._idle.clear()
+        await asyncio.gather(*[self._stop(backend) for backend in backends])
+        if backends:
+            logger.debug(f'stopped {len(backends)} mavsdk_server')
+
+    def shutdown(self):
+        backends = list(self._busy) + [backend for backends in self._idle.values() for backend in backends]
+        self._busy.clear()
+        self._idle.clear()
+        for backend in backends:
+            if backend.alive:
+                backend.process.kill()
+            backend.process.wait()
+
+    def _putIdle(self, backend):
+        backend.idleSince = time.monotonic()
+        self._idle.setdefault(backend.address, []).append(backend)
+        if self._evictTask is None or self._evictTask.done():
+            self._evictTask = asyncio.ensure_future(self._evictLoop())
+
+    async def _evictLoop(self):
+        while any(self._idle.values()):
+            await asyncio.sleep(max(self._idleTimeout / 2, 0.01))
+            await self.evictIdle()
+
+    async def _makeRoom(self):
+        # 최대 개수에 닿으면 가장 오래 쉬고 있던 server 부터 종료한다
+        while len(self) >= self._maxServers:
+            idle = [backend for backends in self._idle.values() for backend in backends]
+            if not idle:
+                raise RuntimeError(f'mavsdk_server pool is full: {self._maxServers} servers in use')
+            backend = min(idle, key=lambda backend: backend.idleSince)
+            self._idle[backend.address].remove(backend)
+            self.evicted += 1
+            await self._stop(backend)
+
+    async def _spawn(self, address):
+        await self._makeRoom()
+        # _freePort 가 닫은 포트를 server 가 bind 하기 전에 다른 프로세스가 가져갈 수 있다.
+        # 그러면 server 가 바로 끝나므로 잠깐 지켜보다가 새 포트로 다시 띄운다.
+        # 기체를 찾은 뒤에야 bind 하다가 끝나는 경우는 DroneCore 의 CONNECT_TIMEOUT 이 server 를 새로 띄운다
+        for _ in range(self.SPAWN_ATTEMPTS):
+            port = _freePort()
+            process = subprocess.Popen(self._command(address, port), stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL)
+            self.spawned += 1
+            deadline = time.monotonic() + self.SPAWN_CHECK
+            while process.poll() is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            if process.poll() is None:
+                logger.debug(f'started mavsdk_server {address} on port {port}')
+                return _Backend(address, port, process)
+            logger.debug(f'mavsdk_server {address} on port {port} exited with {process.returncode}')
+        raise RuntimeError(f'mavsdk_server {address} exited right after start {self.SPAWN_ATTEMPTS} times')
+
+    async def _healthy(self, backend):
+        # 프로세스가 살아 있고, gRPC 포트가 한 번 열렸다면 지금도 연결을 받아야 한다
+        if not backend.alive:
+            return False
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', backend.port),
+                                               self.HEALTH_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            return not backend.ready
+        writer.close()
+        backend.ready = True
+        return True
+
+    async def _stop(self, backend):
+        process = backend.process
+        if process.poll() is None:
+            process.terminate()
+            deadline = time.monotonic() + self.STOP_TIMEOUT
+            while process.poll() is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            if process.poll() is None:
+                process.kill()
+        process.wait()
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+
+from tickScheduler import TickScheduler
+
+logger = logging.getLogger()
+
+
+class _PumpEntry:
+    def __init__(self, drone, now):
+        self.drone = drone
+        self.since = now
+        self.sentAtStart = drone.setpointsSent
+        # pump 가 마지막으로 확인한 전송 횟수. 이보다 늘었으면 pump 밖에서 보낸 것이다
+        self.seen = drone.setpointsSent
+        self.sending = None
+        self.pumped = 0
+        self.fresh = 0
+        self.busy = 0
+        self.failures = 0
+
+
+class SetpointPump:
+    # offboard 중인 드론들의 마지막 setpoint 를 일정 주기로 다시 보낸다. 타이머 하나로 모든 드론을 돈다
+    instance = None
+    RATE = 20.0
+
+    def __init__(self, rate=RATE):
+        self._scheduler = TickScheduler(rate)
+        self._entries = dict()
+        self._task = None
+
+    @classmethod
+    def getInstance(cls):
+        if cls.instance is None:
+            cls.instance = SetpointPump()
+        return cls.instance
+
+    @property
+    def rate(self):
+        return self._scheduler.frequency
+
+    @rate.setter
+    def rate(self, val):
+        if val <= 0:
+            raise ValueError(f'setpoint rate must be positive, got {val}')
+        self._scheduler.frequency = val
+
+    def __contains__(self, drone):
+        entry = self._entries.get(drone.index)
+        return entry is not None and entry.drone is drone
+
+    def add(self, drone):
+        self._entries[drone.index] = _PumpEntry(drone, time.monotonic())
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._scheduler.run(self._tick))
+
+    def remove(self, drone):
+        entry = self._entries.get(drone.index)
+        if entry is None or entry.drone is not drone:
+            return
+        del self._entries[drone.index]
+        if entry.sending is not None:
+            entry.sending.cancel()
+        if not self._entries and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self):
+        now = time.monotonic()
+        drones = list()
+        for index, entry in sorted(self._entries.items()):
+            elapsed = now - entry.since
+            sent = entry.drone.setpointsSent - entry.sentAtStart
+            drones.append({'index': index,
+                           'active': entry.drone.activeSetpoint,
+                           'achievedRate': sent / elapsed if elapsed > 0 else 0.0,
+                           'pumped': entry.pumped,
+                           'fresh': entry.fresh,
+                           'busy': entry.busy,
+                           'failures': entry.failures,
+                           'lastSendAge': entry.drone.setpointAge(now)})
+        stats = self._scheduler.stats()
+        stats['drones'] = drones
+        return stats
+
+    async def _tick(self):
+        # 다음 tick 을 막지 않도록 보내기만 시작하고 기다리지 않는다
+        now = time.monotonic()
+        halfPeriod = 0.5 / self._scheduler.frequency
+        for entry in list(self._entries.values()):
+            if entry.sending is not None:
+                # 이전 전송이 아직 끝나지 않았으면 이번 tick 은 건너뛴다
+                entry.busy += 1
+                continue
+            sent = entry.drone.setpointsSent
+            if sent != entry.seen and entry.drone.setpointAge(now) < halfPeriod:
+                # client 명령이나 follow 가 방금 보냈다
+                entry.seen = sent
+                entry.fresh += 1
+                continue
+            entry.sending = asyncio.ensure_future(self._send(entry))
+
+    async def _send(self, entry):
+        try:
+            await entry.drone.resend_setpoint()
+            entry.seen = entry.drone.setpointsSent
+            entry.pumped += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            entry.failures += 1
+            if entry.failures == 1 or entry.failures % 100 == 0:
+                logger.debug(f'drone {entry.drone.index} setpoint resend failed ({entry.failures}): {e!r}')
+        finally:
+            entry.sending = None
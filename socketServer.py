@@ -1,38 +1,35 @@
-from PyQt5.QtCore import QUrl, QObject, pyqtSlot, pyqtSignal
+from PyQt5.QtCore import QUrl, QObject, pyqtSlot, pyqtSignal, QTimer
 from PyQt5.QtNetwork import QTcpServer, QTcpSocket, QHostAddress
 
 import sys
 import logging
-import json
+
+from serverCore import ServerCore
+from telemetryAggregator import TelemetryAggregator
 
 logger = logging.getLogger()
 
 
-class SocketServer(QObject):
+class SocketServer(QObject, ServerCore):
     instance = None
-    connect = pyqtSignal(int, str, str)
-    setLeaderDrone = pyqtSignal(int)
-    addFollowerDrone = pyqtSignal(int, float, float)
-    removeFollowerDrone = pyqtSignal(int)
-    readyToFollow = pyqtSignal()
-    followLeader = pyqtSignal(float)
-    stopFollow = pyqtSignal()
-    setFollowFrequency = pyqtSignal(float)
-    arm = pyqtSignal(int)
-    startOffboardMode = pyqtSignal(int)
-    stopOffboardMode = pyqtSignal(int)
-    setVelocityBody = pyqtSignal(int, float, float, float, float)
-    setVelocityNED = pyqtSignal(int, float, float, float, float)
-    setAttitude = pyqtSignal(int, float, float, float, float)
-    setPositionNED = pyqtSignal(int, float, float, float, float)
     closeServer = pyqtSignal()
+    _immediate = pyqtSignal(str, object)
+    _reply = pyqtSignal(object, str, object, object)
 
     def __init__(self, parent=None):
-        super().__init__(parent)
+        # QObject 가 쓰지 않는 keyword 인자는 PyQt 가 ServerCore.__init__ 으로 넘긴다
+        super().__init__(parent=parent, startFrameTimer=self._startTimer, stopFrameTimer=self._stopTimer,
+                         sendReply=self._postReply)
 
         self.server = QTcpServer(self)
         self.server.newConnection.connect(self._new_connection)
-        self.clients = []
+
+        # DroneProxy 는 AsyncThread 에서 telemetry 를 publish 하므로 signal 로 이 스레드에 넘겨서 보낸다
+        self._immediate.connect(self.send_message)
+        self._reply.connect(self._sendReply)
+        self._frameTimer = QTimer(self)
+        self._frameTimer.timeout.connect(TelemetryAggregator.getInstance().flush)
+        TelemetryAggregator.getInstance().setSinks(self.send_frame, self._immediate.emit)
 
     @classmethod
     def getInstance(cls):
@@ -41,67 +38,40 @@ class SocketServer(QObject):
         return cls.instance
 
     def close(self):
+        super().close()
         self.server.close()
 
     def start_server(self):
-        if not self.server.listen(QHostAddress.Any, 12345):
+        if not self.server.listen(QHostAddress.Any, self.PORT):
             logger.debug("Unable to start the server:", self.server.errorString())
             self.close()
 
-        logger.debug("Server started on port 12345")
+        logger.debug(f"Server started on port {self.PORT}")
+        self.setTelemetryRate(TelemetryAggregator.getInstance().rate)
+
+    def _postReply(self, client_socket, func, result, error=None):
+        self._reply.emit(client_socket, func, result, error)
+
+    def _startTimer(self, interval):
+        self._frameTimer.start(max(1, int(interval * 1000)))
+
+    def _stopTimer(self):
+        self._frameTimer.stop()
+
+    def _serverClosed(self):
+        self.closeServer.emit()
 
     def _new_connection(self):
         client_socket = self.server.nextPendingConnection()
         client_socket.readyRead.connect(lambda: self.receive_message(client_socket))
+        client_socket.bytesWritten.connect(lambda _: self._pump(client_socket))
+        client_socket.disconnected.connect(lambda: self._remove_client(client_socket))
 
-        self.clients.append(client_socket)
-        logger.debug("New connection")
+        self._add_client(client_socket, f'{client_socket.peerAddress().toString()}:{client_socket.peerPort()}')
+
+    def _remove_client(self, client_socket):
+        if super()._remove_client(client_socket) is not None:
+            client_socket.deleteLater()
 
     def receive_message(self, client_socket):
-        message = client_socket.readAll().data().decode()
-        data = json.loads(message)
-        logger.debug(f"Received from client: {data}")
-
-        func = data['func']
-        args = data['args']
-
-        if func == "connect":
-            self.connect.emit(*args)
-        elif func == "setLeaderDrone":
-            self.setLeaderDrone.emit(*args)
-        elif func == "addFollowerDrone":
-            self.addFollowerDrone.emit(*args)
-        elif func == "removeFollowerDrone":
-            self.removeFollowerDrone.emit(*args)
-        elif func == "readyToFollow":
-            self.readyToFollow.emit(*args)
-        elif func == "followLeader":
-            self.followLeader.emit(*args)
-        elif func == "stopFollow":
-            self.stopFollow.emit(*args)
-        elif func == "setFollowFrequency":
-            self.setFollowFrequency.emit(*args)
-        elif func == "arm":
-            self.arm.emit(*args)
-        elif func == "startOffboardMode":
-            self.startOffboardMode.emit(*args)
-        elif func == "stopOffboardMode":
-            self.stopOffboardMode.emit(*args)
-        elif func == "setVelocityBody":
-            self.setVelocityBody.emit(*args)
-        elif func == "setVelocityNED":
-            self.setVelocityNED.emit(*args)
-        elif func == "setAttitude":
-            self.setAttitude.emit(*args)
-        elif func == "setPositionNED":
-            self.setPositionNED.emit(*args)
-        elif func == "closeServer":
-            self.close()
-            self.closeServer.emit(*args)
-
-    def send_message(self, msgType, value):
-        data = {"type": msgType, "value": value}
-        message = json.dumps(data) + '\n'
-        for client in self.clients:
-            client.write(message.encode())
-            client.flush()
+        self.receive_data(client_socket, client_socket.readAll().data())
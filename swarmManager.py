@@ -1,27 +1,74 @@
 import asyncio
-from mavsdk.offboard import (OffboardError, VelocityBodyYawspeed, VelocityNedYaw, Attitude, PositionNedYaw, PositionGlobalYaw)
-from droneProxy import DroneProxy
-from haversine import inverse_haversine, Unit
-import math
+from droneCore import DroneCore
+from formationSolver import FormationSolver
+from tickScheduler import BatchTickScheduler
+from droneState import VersionClock, EARTH_RADIUS_M
 import logging
+import math
+import time
 
 logger = logging.getLogger()
 
 
-class SwarmManager:
-    instance = None
-
-    def __init__(self):
+class Swarm:
+    # 리더 하나와 팔로워들로 된 편대. follow tick 은 SwarmManager 의 공유 scheduler 가 돌린다
+    MAX_PARALLEL_SETPOINTS = 16
+    # 리더 위치를 이 시간 이상 앞으로 외삽하지 않는다
+    MAX_PREDICTION_HORIZON = 1.0
+    # 리더 snapshot 이 이보다 오래되면 팔로워에게 명령을 보내지 않는다
+    STALE_LEADER_TIMEOUT = 2.0
+
+    # readyToFollow 의 통과 조건: 모든 팔로워, quorum 비율 이상, 한 대 이상
+    BARRIER_ALL = 'all'
+    BARRIER_QUORUM = 'quorum'
+    BARRIER_BEST_EFFORT = 'bestEffort'
+    BARRIERS = (BARRIER_ALL, BARRIER_QUORUM, BARRIER_BEST_EFFORT)
+    MAX_PARALLEL_PREPARE = 16
+    # 팔로워 한 대의 arm + offboard 시작 제한 시간
+    PREPARE_TIMEOUT = 10.0
+    # arm 이후 offboard 를 시작하기 전에 기다리는 시간
+    ARM_SETTLE = 0.1
+
+    def __init__(self, swarmId=0):
+        self._id = swarmId
         self._leader = None
         self._followers = list()
-        self._task_follow = None
+        self._following = False
         self._followFrequency = 1.0
+        # (팔로워 목록, solver) 를 한 번에 교체해서 follow 가 항상 같은 구성의 두 값을 읽게 한다
+        self._formation = (list(), FormationSolver())
+        self._setpointSemaphore = asyncio.Semaphore(self.MAX_PARALLEL_SETPOINTS)
+        self._setpointFailures = dict()
+        self._staleTicks = 0
+
+        self._barrier = self.BARRIER_ALL
+        self._quorum = 0.5
+        self._prepareSemaphore = asyncio.Semaphore(self.MAX_PARALLEL_PREPARE)
+        self._lastReady = None
+
+        self._leadCompensation = True
+        self._commandLatency = 0.05
+        self._pendingPrediction = None
+        self._predictionError = {'samples': 0, 'predicted': 0.0, 'raw': 0.0}
+        self._version = 0
+        self._touch()
 
-    @classmethod
-    def getInstance(cls):
-        if cls.instance is None:
-            cls.instance = SwarmManager()
-        return cls.instance
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def leader(self):
+        return self._leader
+
+    @property
+    def following(self):
+        return self._following
+
+    @following.setter
+    def following(self, val):
+        self._following = val
+        self._touch()
 
     @property
     def followFrequency(self):
@@ -30,91 +77,245 @@ class SwarmManager:
     @followFrequency.setter
     def followFrequency(self, val):
         self._followFrequency = val
+        self._touch()
+
+    @property
+    def version(self):
+        return self._version
 
-    def setLeader(self, leader: DroneProxy):
+    @property
+    def lastReady(self):
+        return self._lastReady
+
+    def followerDrones(self):
+        return [follower['drone'] for follower in self._followers]
+
+    def setReadyBarrier(self, barrier, quorum):
+        if barrier not in self.BARRIERS:
+            raise ValueError(f'unknown barrier: {barrier}, available: {list(self.BARRIERS)}')
+        if not 0 < quorum <= 1:
+            raise ValueError(f'quorum must be in (0, 1], got {quorum}')
+        logger.debug(f'swarm {self._id} barrier: {barrier}, quorum: {quorum}')
+        self._barrier = barrier
+        self._quorum = quorum
+
+    def setLeadCompensation(self, enabled, commandLatency):
+        logger.debug(f'swarm {self._id} enabled: {enabled}, commandLatency: {commandLatency}')
+        self._leadCompensation = enabled
+        self._commandLatency = commandLatency
+        self._predictionError = {'samples': 0, 'predicted': 0.0, 'raw': 0.0}
+
+    def followStats(self):
+        # scheduler 통계는 SwarmManager.followStats 가 더한다
+        samples = self._predictionError['samples']
+        return {'swarmId': self._id,
+                'running': self._following,
+                'setpointFailures': dict(self._setpointFailures),
+                'staleLeaderTicks': self._staleTicks,
+                'leadCompensation': self._leadCompensation,
+                'commandLatency': self._commandLatency,
+                'predictionSamples': samples,
+                'predictedErrorRms': math.sqrt(self._predictionError['predicted'] / samples) if samples else 0.0,
+                'rawErrorRms': math.sqrt(self._predictionError['raw'] / samples) if samples else 0.0,
+                'lastReady': self._lastReady}
+
+    def _touch(self):
+        with VersionClock.getInstance() as version:
+            self._version = version
+
+    def snapshot(self):
+        followers, _ = self._formation
+        return {'id': self._id,
+                'version': self._version,
+                'leader': self._leader.index if self._leader is not None else None,
+                'followers': [{'index': follower['drone'].index, 'distance': follower['distance'],
+                               'angle': follower['angle']} for follower in followers],
+                'following': self._following,
+                'followFrequency': self._followFrequency}
+
+    def setLeader(self, leader: DroneCore):
         logger.debug('')
         self._leader = leader
+        self._touch()
 
-    def addFollower(self, drone: DroneProxy, distance: float, angle: float):
+    def addFollower(self, drone: DroneCore, distance: float, angle: float):
         logger.debug('')
         for follower in self._followers:
             if follower['drone'] == drone:
                 return
 
         self._followers.append({'drone': drone, 'distance': distance, 'angle': angle})
+        self._rebuildFormation()
 
         logger.debug(f'followers {self._followers}')
 
-    def removeFollower(self, drone: DroneProxy):
+    def removeFollower(self, drone: DroneCore):
         logger.debug('')
         for follower in self._followers:
             if follower['drone'] == drone:
                 self._followers.remove(follower)
+                self._rebuildFormation()
                 break
 
         logger.debug(f'followers {self._followers}')
 
+    def _rebuildFormation(self):
+        followers = list(self._followers)
+        self._formation = (followers, FormationSolver([(f['distance'], f['angle']) for f in followers]))
+        self._touch()
+
     async def readyToFollow(self):
+        # 팔로워들을 동시에 arm / offboard 시작하고, barrier 를 통과했는지와 드론별 결과를 한 번에 돌려준다
         logger.debug('')
+        started = time.monotonic()
+        result = {'swarmId': self._id, 'barrier': self._barrier, 'quorum': self._quorum, 'required': 0,
+                  'passed': False, 'ready': [], 'failed': [], 'elapsed': 0.0}
         if self._leader is None:
             logger.debug("ready_to_follow leader is None.")
-            return
+            result['error'] = 'leader is not set'
+            return result
 
         if not self._followers:
             logger.debug("ready_to_follow followers are Empty.")
-            return
-
-        for follower in self._followers:
-            drone = follower['drone']
-            await drone.arm()
-            await asyncio.sleep(0.1)
-            await drone.start_offboard_mode()
+            result['error'] = 'no followers'
+            return result
+
+        drones = [follower['drone'] for follower in self._followers]
+        outcomes = await asyncio.gather(*[self._prepareFollower(drone) for drone in drones], return_exceptions=True)
+
+        ready = list()
+        for drone, outcome in zip(drones, outcomes):
+            if outcome is None:
+                ready.append(drone)
+            else:
+                reason = outcome if isinstance(outcome, str) else repr(outcome)
+                result['failed'].append({'index': drone.index, 'reason': reason})
+                logger.debug(f'follower {drone.index} is not ready: {reason}')
+
+        required = {self.BARRIER_ALL: len(drones),
+                    self.BARRIER_QUORUM: max(1, math.ceil(self._quorum * len(drones))),
+                    self.BARRIER_BEST_EFFORT: 1}[self._barrier]
+        result['required'] = required
+        result['ready'] = [drone.index for drone in ready]
+        result['passed'] = len(ready) >= required
+
+        # barrier 를 통과하지 못하면 준비된 드론도 offboard 에 남겨 두지 않고 disarm 한다.
+        # 시간 안에 끝나지 않았거나 예외가 난 드론은 arm 이나 offboard 까지 됐을 수 있으므로 barrier 와 관계없이 되돌린다.
+        # arm 이 실패한 드론은 arm 되지 않았고, offboard 가 실패한 드론은 start_offboard_mode 가 이미 disarm 했다
+        rollback = [drone for drone, outcome in zip(drones, outcomes)
+                    if (not result['passed'] if outcome is None else outcome not in ('arm', 'offboard'))]
+        if rollback:
+            await asyncio.gather(*[self._rollbackFollower(drone) for drone in rollback], return_exceptions=True)
+
+        result['elapsed'] = time.monotonic() - started
+        self._lastReady = result
+        logger.debug(f'ready to follow: {result}')
+        return result
+
+    async def _prepareFollower(self, drone):
+        async with self._prepareSemaphore:
+            try:
+                return await asyncio.wait_for(self._armAndStartOffboard(drone), self.PREPARE_TIMEOUT)
+            except asyncio.TimeoutError:
+                return 'timeout'
+
+    async def _rollbackFollower(self, drone):
+        await drone.stop_offboard_mode()
+        if not await drone.disarm():
+            logger.debug(f'follower {drone.index} could not be disarmed')
+
+    async def _armAndStartOffboard(self, drone):
+        if not await drone.arm():
+            return 'arm'
+        await asyncio.sleep(self.ARM_SETTLE)
+        if not await drone.start_offboard_mode():
+            return 'offboard'
+        return None
 
     async def follow(self):
-        lat = self._leader.latitude
-        lon = self._leader.longitude
-        alt = self._leader.altitude_absolute
-        yaw = self._leader.heading
+        # 리더 상태는 한 snapshot 에서만 읽는다
+        state = self._leader.state
+        now = time.monotonic()
+        if not state.valid or state.age(now) > self.STALE_LEADER_TIMEOUT:
+            self._staleTicks += 1
+            logger.debug(f'leader state is stale, age: {state.age(now) if state.valid else None}')
+            return
 
-        # logger.debug(f'lat:{lat}, lon:{lon}, alt:{alt}, yaw:{yaw}')
+        lat = state.latitude
+        lon = state.longitude
+        alt = state.altitude_absolute
+        yaw = state.heading
+
+        # 리더 위치 샘플의 나이 + 명령 지연만큼 속도로 외삽한다. 오차 측정을 위해 보정을 끈 경우에도 계산한다
+        sampleTime = state.position_timestamp
+        self._measurePrediction(sampleTime, lat, lon)
+        horizon = min(now - sampleTime + self._commandLatency, self.MAX_PREDICTION_HORIZON)
+        predicted_lat, predicted_lon, predicted_alt = self._predictLeader(state, horizon)
+        if self._pendingPrediction is None:
+            self._pendingPrediction = (now + self._commandLatency, predicted_lat, predicted_lon, lat, lon)
+        if self._leadCompensation:
+            lat, lon, alt = predicted_lat, predicted_lon, predicted_alt
 
-        try:
-            for follower in self._followers:
-                follower_lat, follower_lon = self._calculateFollowerPosition(lat, lon, yaw,
-                                                                               follower['distance'],
-                                                                               follower['angle'])
-                # logger.debug(f'follower lat:{follower_lat}, lon:{follower_lon}')
-                await follower['drone'].set_position_global(follower_lat, follower_lon, alt, yaw)
-            await asyncio.sleep(1/self._followFrequency)
-        except OffboardError as e:
-            logger.debug("OffboardError:", e)
-            return
+        # logger.debug(f'lat:{lat}, lon:{lon}, alt:{alt}, yaw:{yaw}')
 
-    async def goToPositionOfLeader(self):
-        logger.debug('')
-        if not self._checkSwarmCondition():
-            return
+        followers, solver = self._formation
+        follower_lats, follower_lons = solver.solve(lat, lon, yaw)
 
-        await self.follow()
+        # 팔로워 setpoint 를 동시에 보내되 동시 요청 수는 semaphore 로 제한한다
+        targets = zip(followers, follower_lats.tolist(), follower_lons.tolist())
+        results = await asyncio.gather(*[self._sendFollowerSetpoint(follower['drone'], follower_lat, follower_lon, alt, yaw)
+                                         for follower, follower_lat, follower_lon in targets],
+                                       return_exceptions=True)
 
-    async def followLeader(self):
-        while True:
-            await self.follow()
+        for follower, result in zip(followers, results):
+            if isinstance(result, Exception):
+                index = follower['drone'].index
+                self._setpointFailures[index] = self._setpointFailures.get(index, 0) + 1
+                logger.debug(f"follower {index} set_position_global failed: {result!r}")
 
-    async def runTaskFollow(self):
-        if not self._checkSwarmCondition():
+    @staticmethod
+    def _predictLeader(state, horizon):
+        lat = state.latitude
+        lon = state.longitude
+        alt = state.altitude_absolute
+        if horizon <= 0 or state.velocity_timestamp == 0.0:
+            return lat, lon, alt
+
+        predicted_lat = lat + math.degrees(state.velocity_north * horizon / EARTH_RADIUS_M)
+        predicted_lon = lon + math.degrees(state.velocity_east * horizon / (EARTH_RADIUS_M * math.cos(math.radians(lat))))
+        return predicted_lat, predicted_lon, alt - state.velocity_down * horizon
+
+    def _measurePrediction(self, sampleTime, lat, lon):
+        # 이전 tick 의 예측 시점 이후에 들어온 리더 샘플과 비교해서 예측/무보정 위치의 오차를 누적한다
+        if self._pendingPrediction is None:
+            return
+        targetTime, predicted_lat, predicted_lon, raw_lat, raw_lon = self._pendingPrediction
+        if sampleTime < targetTime:
             return
 
-        if self._task_follow is None:
-            self._task_follow = asyncio.ensure_future(self.followLeader())
+        self._pendingPrediction = None
+        self._predictionError['samples'] += 1
+        self._predictionError['predicted'] += self._distanceSquared(lat, lon, predicted_lat, predicted_lon)
+        self._predictionError['raw'] += self._distanceSquared(lat, lon, raw_lat, raw_lon)
 
-    def stopFollow(self):
-        if self._task_follow:
-            self._task_follow.cancel()
+    @staticmethod
+    def _distanceSquared(lat1, lon1, lat2, lon2):
+        north = math.radians(lat2 - lat1) * EARTH_RADIUS_M
+        east = math.radians(lon2 - lon1) * EARTH_RADIUS_M * math.cos(math.radians(lat1))
+        return north * north + east * east
 
-        self._task_follow = None
+    async def _sendFollowerSetpoint(self, drone, lat, lon, alt, yaw):
+        async with self._setpointSemaphore:
+            await drone.set_position_global(lat, lon, alt, yaw)
+
+    async def goToPositionOfLeader(self):
+        logger.debug('')
+        if not self.checkCondition():
+            return
+
+        await self.follow()
 
-    def _checkSwarmCondition(self):
+    def checkCondition(self):
         if self._leader is None:
             logger.debug("check_swarm_condition leader is None.")
             return False
@@ -125,29 +326,175 @@ class SwarmManager:
 
         return True
 
-    @staticmethod
-    def _calculateFollowerPosition(leader_latitude, leader_longitude, leader_heading, distance, relative_angle):
-        # 리더 드론의 헤딩 각도를 라디안으로 변환
-        leader_heading_rad = math.radians(leader_heading)
 
-        # 상대적 각도를 라디안으로 변환
-        relative_angle_rad = math.radians(relative_angle)
-
-        # 팔로워 드론의 절대적인 각도 계산
-        absolute_angle_rad = leader_heading_rad + relative_angle_rad
-
-        # logger.debug(f"leader_heading: {leader_heading}")
-        # logger.debug(f"relative_angle: {relative_angle}")
-        # logger.debug(f"leader_heading_rad: {leader_heading_rad}")
-        # logger.debug(f"relative_angle_rad: {relative_angle_rad}")
-        # logger.debug(f"absolute_angle_rad: {absolute_angle_rad}")
+class SwarmManager:
+    # id 로 구분되는 여러 swarm. follow 는 swarm 별 task 대신 BatchTickScheduler 하나가 swarm 별 주기로 돌린다
+    instance = None
+    DEFAULT_SWARM = 0
 
-        leader_pos = (leader_latitude, leader_longitude)
-        follower_pos = inverse_haversine(leader_pos, distance, absolute_angle_rad, unit=Unit.METERS)
+    def __init__(self):
+        self._swarms = dict()
+        self._nextId = self.DEFAULT_SWARM
+        self._removed = dict()
+        self._lastStats = dict()
+        self._scheduler = BatchTickScheduler(self._tick)
+        self._task_follow = None
+        self.createSwarm()
 
-        # 팔로워 드론의 위치 계산
-        follower_latitude = follower_pos[0]
-        follower_longitude = follower_pos[1]
+    @classmethod
+    def getInstance(cls):
+        if cls.instance is None:
+            cls.instance = SwarmManager()
+        return cls.instance
 
-        return follower_latitude, follower_longitude
+    @property
+    def overrunPolicy(self):
+        return self._scheduler.policy
+
+    @overrunPolicy.setter
+    def overrunPolicy(self, val):
+        self._scheduler.policy = val
+
+    def createSwarm(self):
+        swarmId = self._nextId
+        self._nextId += 1
+        self._swarms[swarmId] = Swarm(swarmId)
+        logger.debug(f'swarm {swarmId} created')
+        return swarmId
+
+    def removeSwarm(self, swarmId):
+        if swarmId == self.DEFAULT_SWARM:
+            raise ValueError(f'swarm {swarmId} cannot be removed')
+        self.swarm(swarmId)
+        self.stopFollow(swarmId)
+        del self._swarms[swarmId]
+        self._lastStats.pop(swarmId, None)
+        with VersionClock.getInstance() as version:
+            self._removed[swarmId] = version
+        logger.debug(f'swarm {swarmId} removed')
+
+    def swarm(self, swarmId):
+        swarm = self._swarms.get(swarmId)
+        if swarm is None:
+            raise ValueError(f'unknown swarm: {swarmId}')
+        return swarm
+
+    def swarms(self):
+        return sorted(self._swarms)
+
+    def snapshots(self, sinceVersion=0):
+        return [swarm.snapshot() for _, swarm in sorted(self._swarms.items()) if swarm.version > sinceVersion]
+
+    def removedSince(self, sinceVersion):
+        return [swarmId for swarmId, version in self._removed.items() if version > sinceVersion]
+
+    def setLeader(self, swarmId, leader: DroneCore):
+        swarm = self.swarm(swarmId)
+        if leader is not None and leader in swarm.followerDrones():
+            raise ValueError(f'drone {leader.index} is a follower of swarm {swarmId}')
+        # 다른 swarm 의 팔로워가 이 swarm 의 리더가 되는 chain 은 허용하되 순환은 막는다
+        if leader is not None and any(self._reaches(follower, leader) for follower in swarm.followerDrones()):
+            raise ValueError(f'drone {leader.index} as leader of swarm {swarmId} makes a cycle')
+        swarm.setLeader(leader)
+
+    def addFollower(self, swarmId, drone: DroneCore, distance: float, angle: float):
+        swarm = self.swarm(swarmId)
+        if drone is swarm.leader:
+            raise ValueError(f'drone {drone.index} is the leader of swarm {swarmId}')
+        for other in self._swarms.values():
+            if other is not swarm and drone in other.followerDrones():
+                raise ValueError(f'drone {drone.index} already follows in swarm {other.id}')
+        if swarm.leader is not None and self._reaches(drone, swarm.leader):
+            raise ValueError(f'drone {drone.index} as follower of swarm {swarmId} makes a cycle')
+        swarm.addFollower(drone, distance, angle)
+
+    def removeFollower(self, swarmId, drone: DroneCore):
+        self.swarm(swarmId).removeFollower(drone)
+
+    def setReadyBarrier(self, swarmId, barrier, quorum):
+        self.swarm(swarmId).setReadyBarrier(barrier, quorum)
+
+    def setLeadCompensation(self, swarmId, enabled, commandLatency):
+        self.swarm(swarmId).setLeadCompensation(enabled, commandLatency)
+
+    def _reaches(self, start, target):
+        # 리더 -> 팔로워 방향으로 따라가서 start 에서 target 에 닿는지 본다
+        visited = set()
+        pending = [start]
+        while pending:
+            drone = pending.pop()
+            if drone is target:
+                return True
+            if id(drone) in visited:
+                continue
+            visited.add(id(drone))
+            for swarm in self._swarms.values():
+                if swarm.leader is drone:
+                    pending += swarm.followerDrones()
+        return False
+
+    def removeDrone(self, drone: DroneCore):
+        # 연결이 해제된 드론을 모든 swarm 의 리더/팔로워에서 뺀다
+        for swarmId, swarm in list(self._swarms.items()):
+            if swarm.leader is drone:
+                self.stopFollow(swarmId)
+                swarm.setLeader(None)
+            swarm.removeFollower(drone)
+
+    def setFollowFrequency(self, swarmId, frequency):
+        swarm = self.swarm(swarmId)
+        swarm.followFrequency = frequency
+        self._scheduler.setFrequency(swarmId, frequency)
+
+    async def readyToFollow(self, swarmId):
+        return await self.swarm(swarmId).readyToFollow()
+
+    async def runTaskFollow(self, swarmId):
+        # 따라가지 못하는 이유는 client 가 받도록 ValueError 로 올린다
+        swarm = self.swarm(swarmId)
+        if not swarm.checkCondition():
+            raise ValueError(f'swarm {swarmId} needs a leader and at least one follower')
+
+        if swarm.lastReady is not None and not swarm.lastReady['passed']:
+            logger.debug("run_task_follow last readyToFollow did not pass the barrier.")
+            raise ValueError(f'swarm {swarmId} did not pass the ready barrier: {len(swarm.lastReady["ready"])} of '
+                             f'{swarm.lastReady["required"]} required followers ready')
+
+        if swarmId not in self._scheduler:
+            self._scheduler.add(swarmId, swarm.followFrequency)
+            swarm.following = True
+
+        if self._task_follow is None or self._task_follow.done():
+            self._task_follow = asyncio.ensure_future(self._scheduler.run())
+
+    def stopFollow(self, swarmId):
+        stats = self._scheduler.remove(swarmId)
+        if stats is not None:
+            self._lastStats[swarmId] = stats
+            self.swarm(swarmId).following = False
+
+        # 따라가는 swarm 이 없으면 scheduler task 도 멈춘다
+        if not len(self._scheduler) and self._task_follow is not None:
+            self._task_follow.cancel()
+            self._task_follow = None
 
+    async def _tick(self, swarmId):
+        # scheduler 가 swarm 마다 따로 future 로 실행한다
+        swarm = self._swarms.get(swarmId)
+        if swarm is None:
+            return
+        try:
+            await swarm.follow()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f'swarm {swarmId} follow failed: {e!r}')
+
+    def followStats(self, swarmId):
+        swarm = self.swarm(swarmId)
+        stats = self._scheduler.stats(swarmId) or self._lastStats.get(swarmId) \
+            or {'frequency': swarm.followFrequency, 'policy': self._scheduler.policy, 'ticks': 0}
+        stats.update(swarm.followStats())
+        stats['batches'] = self._scheduler.batches
+        stats['activeSwarms'] = len(self._scheduler)
+        return stats
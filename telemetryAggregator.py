@@ -0,0 +1,59 @@
+import logging
+import threading
+
+logger = logging.getLogger()
+
+
+class TelemetryAggregator:
+    instance = None
+    # 상태 변화 이벤트는 frame 주기를 기다리지 않고 바로 보낸다
+    IMMEDIATE_TYPES = frozenset(('connected', 'connectionState', 'armed', 'flightMode', 'statusText'))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = dict()
+        self._rate = 20.0
+        self._frameSink = None
+        self._immediateSink = None
+        self.published = 0
+        self.frames = 0
+
+    @classmethod
+    def getInstance(cls):
+        if cls.instance is None:
+            cls.instance = TelemetryAggregator()
+        return cls.instance
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, val):
+        self._rate = val
+
+    def setSinks(self, frameSink, immediateSink):
+        self._frameSink = frameSink
+        self._immediateSink = immediateSink
+
+    def publish(self, msgType, value):
+        self.published += 1
+        if msgType in self.IMMEDIATE_TYPES or self._rate <= 0:
+            if self._immediateSink:
+                self._immediateSink(msgType, value)
+            return
+
+        # 같은 드론의 같은 종류 메시지는 다음 frame 전까지 최신 값만 유지한다
+        with self._lock:
+            self._latest[(msgType, value[0])] = value
+
+    def flush(self):
+        with self._lock:
+            if not self._latest:
+                return
+            latest = self._latest
+            self._latest = dict()
+
+        self.frames += 1
+        if self._frameSink:
+            self._frameSink([[msgType, value] for (msgType, _), value in latest.items()])
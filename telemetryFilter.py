@@ -0,0 +1,99 @@
+import logging
+import math
+import time
+
+from droneState import EARTH_RADIUS_M
+
+logger = logging.getLogger()
+
+
+class TelemetryFilter:
+    instance = None
+    # 마지막으로 내보낸 값에서 이만큼 바뀌어야 다시 내보낸다 (m, m, deg, m/s)
+    DEFAULT_DEADBANDS = {'position': 0.1, 'altitude': 0.1, 'heading': 0.5, 'velocity': 0.05}
+    # 값이 그대로여도 이 주기로 한 번은 내보내서 나중에 접속한 client 도 최신 상태를 받게 한다
+    KEYFRAME_INTERVAL = 1.0
+
+    def __init__(self):
+        self._enabled = True
+        self._deadbands = dict(self.DEFAULT_DEADBANDS)
+        self._keyframeInterval = self.KEYFRAME_INTERVAL
+        self._last = dict()
+        self.accepted = dict()
+        self.suppressed = dict()
+
+    @classmethod
+    def getInstance(cls):
+        if cls.instance is None:
+            cls.instance = TelemetryFilter()
+        return cls.instance
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, val):
+        self._enabled = val
+
+    @property
+    def keyframeInterval(self):
+        return self._keyframeInterval
+
+    @keyframeInterval.setter
+    def keyframeInterval(self, val):
+        # 0 이하면 keyframe 을 보내지 않는다
+        self._keyframeInterval = val
+
+    def deadbands(self):
+        return dict(self._deadbands)
+
+    def setDeadband(self, field, value):
+        if field not in self._deadbands:
+            raise ValueError(f'unknown telemetry field: {field}, available: {list(self._deadbands)}')
+        if value < 0:
+            raise ValueError(f'deadband must not be negative, got {value}')
+        self._deadbands[field] = value
+
+    def reset(self, index):
+        # 재연결하면 첫 샘플부터 다시 내보낸다
+        for key in [key for key in self._last if key[0] == index]:
+            del self._last[key]
+
+    def stats(self):
+        return {'enabled': self._enabled,
+                'keyframeInterval': self._keyframeInterval,
+                'deadbands': dict(self._deadbands),
+                'accepted': dict(self.accepted),
+                'suppressed': dict(self.suppressed)}
+
+    def accept(self, index, field, value, now=None):
+        if not self._enabled:
+            return True
+
+        now = time.monotonic() if now is None else now
+        key = (index, field)
+        last = self._last.get(key)
+        # 직전 샘플이 아니라 마지막으로 내보낸 값과 비교하므로 천천히 움직여도 누적되면 내보낸다
+        if (last is None or (0 < self._keyframeInterval <= now - last[1])
+                or self._exceeds(field, last[0], value)):
+            self._last[key] = (value, now)
+            self.accepted[field] = self.accepted.get(field, 0) + 1
+            return True
+
+        self.suppressed[field] = self.suppressed.get(field, 0) + 1
+        return False
+
+    def _exceeds(self, field, last, value):
+        if field == 'position':
+            lat, lon, alt = value
+            north = math.radians(lat - last[0]) * EARTH_RADIUS_M
+            east = math.radians(lon - last[1]) * EARTH_RADIUS_M * math.cos(math.radians(lat))
+            return (north * north + east * east > self._deadbands['position'] ** 2
+                    or abs(alt - last[2]) > self._deadbands['altitude'])
+        if field == 'heading':
+            return abs((value - last + 180.0) % 360.0 - 180.0) > self._deadbands['heading']
+        if field == 'velocity':
+            return max(abs(a - b) for a, b in zip(value, last)) > self._deadbands['velocity']
+        # armed, flightMode 처럼 deadband 가 없는 값은 바뀌었을 때만
+        return value != last
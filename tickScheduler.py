@@ -0,0 +1,206 @@
+import asyncio
+import functools
+import logging
+import time
+
+logger = logging.getLogger()
+
+
+class _Schedule:
+    # 주기 하나의 deadline 과 통계. TickScheduler 와 BatchTickScheduler 가 같이 쓴다
+    def __init__(self, frequency, now=None):
+        self.frequency = frequency
+        self.deadline = now
+        self.started = now
+        # BatchTickScheduler 에서 아직 끝나지 않은 tick
+        self.running = None
+        self.ticks = 0
+        self.missed = 0
+        self.jitterTotal = 0.0
+        self.jitterMax = 0.0
+        self.durationTotal = 0.0
+        self.durationMax = 0.0
+        self.lastDuration = 0.0
+
+    def begin(self, start):
+        jitter = max(start - self.deadline, 0.0)
+        self.jitterTotal += jitter
+        self.jitterMax = max(self.jitterMax, jitter)
+        if jitter >= 1 / self.frequency:
+            # catchUp 으로 밀려서 실행되는 tick
+            self.missed += 1
+
+    def end(self, start, end, policy):
+        # 절대 deadline 기준으로 다음 deadline 을 정하므로 tick 처리 시간이 주기에 누적되지 않는다
+        self.lastDuration = end - start
+        self.durationTotal += self.lastDuration
+        self.durationMax = max(self.durationMax, self.lastDuration)
+        self.ticks += 1
+
+        period = 1 / self.frequency
+        self.deadline += period
+        if end > self.deadline:
+            behind = int((end - self.deadline) / period) + 1
+            if policy == TickScheduler.SKIP or behind > TickScheduler.MAX_CATCH_UP:
+                self.missed += behind
+                self.deadline += behind * period
+
+    def stats(self, policy, now):
+        elapsed = now - self.started if self.started is not None else 0.0
+        ticks = self.ticks
+        return {'frequency': self.frequency,
+                'policy': policy,
+                'ticks': ticks,
+                'achievedRate': ticks / elapsed if elapsed > 0 else 0.0,
+                'missedDeadlines': self.missed,
+                'jitterAvg': self.jitterTotal / ticks if ticks else 0.0,
+                'jitterMax': self.jitterMax,
+                'durationAvg': self.durationTotal / ticks if ticks else 0.0,
+                'durationMax': self.durationMax,
+                'lastDuration': self.lastDuration}
+
+
+class TickScheduler:
+    SKIP = 'skip'
+    CATCH_UP = 'catchUp'
+    POLICIES = (SKIP, CATCH_UP)
+    # catchUp 이라도 이보다 많이 밀리면 나머지는 건너뛴다
+    MAX_CATCH_UP = 5
+
+    def __init__(self, frequency=1.0, policy=SKIP, clock=time.monotonic):
+        self._policy = policy
+        self._clock = clock
+        self._schedule = _Schedule(frequency)
+
+    @property
+    def frequency(self):
+        return self._schedule.frequency
+
+    @frequency.setter
+    def frequency(self, val):
+        # 다음 deadline 계산부터 적용된다
+        self._schedule.frequency = val
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @policy.setter
+    def policy(self, val):
+        if val not in self.POLICIES:
+            raise ValueError(f'unknown overrun policy: {val}')
+        self._policy = val
+
+    def resetStats(self):
+        self._schedule = _Schedule(self._schedule.frequency)
+
+    def stats(self):
+        return self._schedule.stats(self._policy, self._clock())
+
+    async def run(self, tick):
+        self._schedule = schedule = _Schedule(self._schedule.frequency, self._clock())
+        while True:
+            delay = schedule.deadline - self._clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            start = self._clock()
+            schedule.begin(start)
+            await tick()
+            schedule.end(start, self._clock(), self._policy)
+
+
+class BatchTickScheduler:
+    # 주기가 다른 여러 작업을 task 하나로 돌린다. deadline 이 BATCH_WINDOW 안에 모인 작업들은 한 번에 깨어나서 시작한다.
+    # 작업마다 tick 을 따로 future 로 돌리므로 느린 작업이 다른 작업의 주기를 늦추지 않는다
+    BATCH_WINDOW = 0.002
+
+    def __init__(self, tick, policy=TickScheduler.SKIP, clock=time.monotonic):
+        # tick(key): deadline 이 된 작업 하나를 실행하는 coroutine
+        self._tick = tick
+        self._policy = policy
+        self._clock = clock
+        self._schedules = dict()
+        self._wakeup = None
+        self.batches = 0
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @policy.setter
+    def policy(self, val):
+        if val not in TickScheduler.POLICIES:
+            raise ValueError(f'unknown overrun policy: {val}')
+        self._policy = val
+
+    def __contains__(self, key):
+        return key in self._schedules
+
+    def __len__(self):
+        return len(self._schedules)
+
+    def add(self, key, frequency):
+        # 처음 tick 은 바로 실행한다
+        self._schedules[key] = _Schedule(frequency, self._clock())
+        self._wake()
+
+    def remove(self, key):
+        # 실행 중인 tick 은 취소하고 마지막 통계를 돌려준다
+        schedule = self._schedules.pop(key, None)
+        self._wake()
+        if schedule is None:
+            return None
+        if schedule.running is not None:
+            schedule.running.cancel()
+        return schedule.stats(self._policy, self._clock())
+
+    def setFrequency(self, key, frequency):
+        # 다음 deadline 계산부터 적용된다
+        schedule = self._schedules.get(key)
+        if schedule is not None:
+            schedule.frequency = frequency
+            self._wake()
+
+    def stats(self, key):
+        schedule = self._schedules.get(key)
+        return schedule.stats(self._policy, self._clock()) if schedule is not None else None
+
+    def _wake(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    def _finished(self, key, schedule, start, future):
+        # 이전 tick 이 끝나지 않은 작업은 시작하지 않으므로, 밀린 deadline 은 여기서 overrun 정책대로 처리된다
+        schedule.running = None
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.debug(f'tick {key} failed: {future.exception()!r}')
+        schedule.end(start, self._clock(), self._policy)
+        self._wake()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # 작업이 추가되거나, 주기가 바뀌거나, tick 이 끝나면 깨어나서 deadline 을 다시 계산한다
+            idle = [schedule.deadline for schedule in self._schedules.values() if schedule.running is None]
+            delay = min(idle) - self._clock() if idle else None
+            if delay is None or delay > 0:
+                self._wakeup = loop.create_future()
+                timer = loop.call_later(delay, self._wake) if delay is not None else None
+                try:
+                    await self._wakeup
+                finally:
+                    self._wakeup = None
+                    if timer is not None:
+                        timer.cancel()
+                continue
+
+            start = self._clock()
+            for key, schedule in self._schedules.items():
+                if schedule.running is None and schedule.deadline <= start + self.BATCH_WINDOW:
+                    schedule.begin(start)
+                    schedule.running = asyncio.ensure_future(self._tick(key))
+                    schedule.running.add_done_callback(functools.partial(self._finished, key, schedule, start))
+            self.batches += 1
@@ -0,0 +1,369 @@
+import json
+import struct
+
+from messageFraming import FrameBuffer, LengthPrefixedFrameBuffer
+from commandRegistry import DRONE_INDEX, CommandError
+
+_STR_LENGTH = struct.Struct('<H')
+_TYPE_ID = struct.Struct('<B')
+_SEQUENCE = struct.Struct('<II')
+
+
+def _writeVarint(out, value):
+    # zigzag 로 음수도 작은 값이면 짧게 쓴다
+    value = value * 2 if value >= 0 else -value * 2 - 1
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _readVarint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return (value >> 1 if not value & 1 else -(value >> 1) - 1), offset
+
+
+class JsonCodec:
+    name = 'json'
+
+    def newFramer(self):
+        return FrameBuffer()
+
+    def decode(self, frame):
+        return json.loads(frame)
+
+    def encode(self, msgType, value):
+        return (json.dumps({"type": msgType, "value": value}) + '\n').encode()
+
+    def encodeFrame(self, items):
+        return self.encode('frame', items)
+
+    def newStream(self):
+        return None
+
+
+class _Record:
+    # telemetry 메시지 하나를 고정 layout 으로 pack 한다. 마지막 필드가 문자열이면 길이 + utf-8 로 붙인다
+    def __init__(self, typeId, fmt, text=False):
+        self.typeId = typeId
+        self.struct = struct.Struct('<B' + fmt)
+        self.text = text
+
+    def pack(self, value):
+        if self.text:
+            index, text = value
+            data = text.encode()
+            return self.struct.pack(self.typeId, index) + _STR_LENGTH.pack(len(data)) + data
+        return self.struct.pack(self.typeId, *value)
+
+    def unpack(self, payload):
+        value = self.struct.unpack_from(payload)[1:]
+        if self.text:
+            offset = self.struct.size
+            length, = _STR_LENGTH.unpack_from(payload, offset)
+            offset += _STR_LENGTH.size
+            value = value + (payload[offset:offset + length].decode(),)
+        return list(value)
+
+
+class BinaryCodec:
+    name = 'binary'
+
+    # type id 0 은 layout 이 없는 메시지(reply, error 등)를 JSON 으로 감싸 보낼 때 사용한다
+    FALLBACK_TYPE = 0
+    FRAME_TYPE = 255
+    RECORDS = {
+        'position': _Record(1, 'Hddf'),
+        'heading': _Record(2, 'Hf'),
+        'armed': _Record(3, 'H?'),
+        'connected': _Record(4, 'H?'),
+        'flightMode': _Record(5, 'H', text=True),
+        'statusText': _Record(6, 'H', text=True),
+        'connectionState': _Record(7, 'H', text=True),
+    }
+    _FORMATS = {DRONE_INDEX: 'i', int: 'i', float: 'd', bool: '?'}
+
+    def __init__(self, registry):
+        self._registry = registry
+        self._decoders = dict()
+        self._typesById = {record.typeId: msgType for msgType, record in self.RECORDS.items()}
+
+    def describe(self):
+        types = {msgType: record.typeId for msgType, record in self.RECORDS.items()}
+        types['frame'] = self.FRAME_TYPE
+        return {"commands": {command.name: command.id for command in self._registry.commands()},
+                "types": types}
+
+    def newFramer(self):
+        return LengthPrefixedFrameBuffer()
+
+    def newStream(self):
+        # client 별 상태가 필요한 codec 만 stream 을 만든다
+        return None
+
+    def encode(self, msgType, value):
+        return LengthPrefixedFrameBuffer.frame(self._encodeItem(msgType, value))
+
+    def _encodeItem(self, msgType, value):
+        record = self.RECORDS.get(msgType)
+        if record is None:
+            return _TYPE_ID.pack(self.FALLBACK_TYPE) + json.dumps({"type": msgType, "value": value}).encode()
+        return record.pack(value)
+
+    def encodeFrame(self, items):
+        # frame = FRAME_TYPE + (u16 길이 + record) 반복
+        parts = [_TYPE_ID.pack(self.FRAME_TYPE)]
+        for msgType, value in items:
+            payload = self._encodeItem(msgType, value)
+            parts.append(_STR_LENGTH.pack(len(payload)))
+            parts.append(payload)
+        return LengthPrefixedFrameBuffer.frame(b''.join(parts))
+
+    def decodeTelemetry(self, frame):
+        typeId = frame[0]
+        if typeId == self.FALLBACK_TYPE:
+            return json.loads(frame[1:])
+        if typeId == self.FRAME_TYPE:
+            items = list()
+            offset = 1
+            while offset < len(frame):
+                length, = _STR_LENGTH.unpack_from(frame, offset)
+                offset += _STR_LENGTH.size
+                item = self.decodeTelemetry(frame[offset:offset + length])
+                items.append([item["type"], item["value"]])
+                offset += length
+            return {"type": "frame", "value": items}
+        msgType = self._typesById[typeId]
+        return {"type": msgType, "value": self.RECORDS[msgType].unpack(frame)}
+
+    def encodeCommand(self, func, args):
+        command = next(command for command in self._registry.commands() if command.name == func)
+        # binary frame 은 인자 layout 이 고정이므로 생략한 인자는 기본값으로 채워 보낸다
+        if len(args) < len(command.argTypes):
+            args = list(args) + list(command.defaults[len(args) - command.required:])
+        data = _TYPE_ID.pack(command.id)
+        for argType, value in zip(command.argTypes, args):
+            if argType is str or argType is list:
+                text = (value if argType is str else json.dumps(value)).encode()
+                data += _STR_LENGTH.pack(len(text)) + text
+            else:
+                data += struct.pack('<' + self._FORMATS[argType], value)
+        return LengthPrefixedFrameBuffer.frame(data)
+
+    def decode(self, frame):
+        if not frame:
+            raise CommandError('empty frame')
+        commandId = frame[0]
+        decoder = self._decoders.get(commandId)
+        if decoder is None:
+            decoder = self._compileDecoder(commandId)
+        try:
+            return decoder(frame)
+        except (struct.error, ValueError) as e:
+            raise CommandError(f'malformed frame for command id {commandId}: {e}')
+
+    def _compileDecoder(self, commandId):
+        command = next((command for command in self._registry.commands() if command.id == commandId), None)
+        if command is None:
+            raise CommandError(f'unknown command id: {commandId}')
+
+        # 가변 길이 인자(문자열, list 는 JSON) 사이의 고정 크기 인자들을 하나의 Struct 로 묶어서 미리 만들어 둔다
+        # 기본값이 있는 뒤쪽 인자는 하나씩 따로 읽어서, 그 인자들을 생략한 frame 도 읽을 수 있게 한다
+        steps = list()
+        fmt = ''
+        for argType in command.argTypes[:command.required]:
+            if argType is str or argType is list:
+                if fmt:
+                    steps.append(struct.Struct('<' + fmt))
+                    fmt = ''
+                steps.append(argType)
+            else:
+                fmt += self._FORMATS[argType]
+        if fmt:
+            steps.append(struct.Struct('<' + fmt))
+        requiredSteps = len(steps)
+        for argType in command.argTypes[command.required:]:
+            steps.append(argType if argType is str or argType is list else struct.Struct('<' + self._FORMATS[argType]))
+
+        name = command.name
+
+        def decoder(frame):
+            args = list()
+            offset = 1
+            for position, step in enumerate(steps):
+                if position >= requiredSteps and offset >= len(frame):
+                    break
+                if step is str or step is list:
+                    length, = _STR_LENGTH.unpack_from(frame, offset)
+                    offset += _STR_LENGTH.size
+                    text = frame[offset:offset + length].decode()
+                    args.append(text if step is str else json.loads(text))
+                    offset += length
+                else:
+                    args.extend(step.unpack_from(frame, offset))
+                    offset += step.size
+            return {"func": name, "args": args}
+
+        self._decoders[commandId] = decoder
+        return decoder
+
+
+class DeltaCodec(BinaryCodec):
+    # 명령과 이벤트는 binary 와 같고, telemetry frame 만 client 가 ack 한 상태에 대한 정수 delta 로 보낸다
+    name = 'delta'
+
+    DELTA_FRAME_TYPE = 254
+    # record 의 type id 에 이 bit 가 있으면 기준 상태에 대한 delta, 없으면 절대값
+    DELTA_FLAG = 0x80
+    # 위도/경도 1e-7 도 (약 1 cm), 고도 mm, 헤딩 0.01 도
+    SCALES = {'position': (1e7, 1e7, 1e3), 'heading': (1e2,)}
+    KEYFRAME_INTERVAL = 100
+    HISTORY = 64
+
+    def describe(self):
+        description = super().describe()
+        description['types']['deltaFrame'] = self.DELTA_FRAME_TYPE
+        description['scales'] = {msgType: list(scales) for msgType, scales in self.SCALES.items()}
+        description['keyframeInterval'] = self.KEYFRAME_INTERVAL
+        description['history'] = self.HISTORY
+        return description
+
+    def newStream(self):
+        return DeltaStream(self)
+
+
+class DeltaStream:
+    # client 하나에 보낸 frame 들의 상태를 seq 별로 기억하고, 마지막으로 ack 받은 상태를 기준으로 delta 를 만든다.
+    # frame 이 버려져도 다음 frame 이 ack 된 상태와의 차이를 모두 담으므로 client 는 어긋나지 않는다.
+    # 연결이 해제된 드론처럼 KEYFRAME_INTERVAL 동안 갱신되지 않은 상태는 keyframe 에서 뺀다
+    def __init__(self, codec):
+        self._codec = codec
+        self._current = dict()
+        self._updated = dict()
+        self._history = dict()
+        self._seq = 0
+        self._acked = None
+        self.keyframes = 0
+        self.deltas = 0
+
+    def ack(self, seq):
+        if seq in self._history and (self._acked is None or seq > self._acked):
+            self._acked = seq
+
+    def stats(self):
+        return {'seq': self._seq, 'acked': self._acked, 'keyframes': self.keyframes, 'deltas': self.deltas}
+
+    def encodeFrame(self, items):
+        codec = self._codec
+        seq = self._seq + 1
+        raw = list()
+        for msgType, value in items:
+            scales = codec.SCALES.get(msgType)
+            if scales is None:
+                raw.append((msgType, value))
+                continue
+            key = (msgType, value[0])
+            self._current[key] = tuple(int(round(v * scale)) for v, scale in zip(value[1:], scales))
+            self._updated[key] = seq
+
+        baseline = None
+        if self._acked is not None and seq % codec.KEYFRAME_INTERVAL:
+            baseline = self._history.get(self._acked)
+        if baseline is None:
+            # keyframe 은 client 의 상태를 새로 시작하므로 여기서 뺀 드론은 client 에서도 사라진다
+            for key in [key for key, updated in self._updated.items() if seq - updated >= codec.KEYFRAME_INTERVAL]:
+                del self._current[key]
+                del self._updated[key]
+
+        out = bytearray(_TYPE_ID.pack(codec.DELTA_FRAME_TYPE))
+        out += _SEQUENCE.pack(seq, self._acked if baseline is not None else 0)
+        entries = 0
+        for (msgType, index), quantized in self._current.items():
+            base = baseline.get((msgType, index)) if baseline is not None else None
+            if base == quantized:
+                continue
+            typeId = codec.RECORDS[msgType].typeId
+            if base is None:
+                out.append(typeId)
+                values = quantized
+            else:
+                out.append(typeId | codec.DELTA_FLAG)
+                values = [value - previous for value, previous in zip(quantized, base)]
+            _writeVarint(out, index)
+            for value in values:
+                _writeVarint(out, value)
+            entries += 1
+
+        for msgType, value in raw:
+            payload = codec._encodeItem(msgType, value)
+            out.append(codec.FALLBACK_TYPE)
+            _writeVarint(out, len(payload))
+            out += payload
+
+        if baseline is not None and not entries and not raw:
+            return None
+
+        self._seq = seq
+        self._history[seq] = dict(self._current)
+        # ack 가 HISTORY 보다 늦으면 기준 상태가 없으므로 keyframe 을 보낸다
+        self._history.pop(seq - codec.HISTORY, None)
+        if baseline is None:
+            self.keyframes += 1
+        else:
+            self.deltas += 1
+        return LengthPrefixedFrameBuffer.frame(bytes(out))
+
+
+class DeltaDecoder:
+    # client 쪽 복원 방법. 받은 frame 의 seq 를 ackTelemetry 로 보내야 다음 frame 이 delta 가 된다
+    def __init__(self, codec):
+        self._codec = codec
+        self._typesById = {record.typeId: msgType for msgType, record in codec.RECORDS.items()}
+        self._states = dict()
+
+    def decode(self, frame):
+        codec = self._codec
+        seq, baselineSeq = _SEQUENCE.unpack_from(frame, _TYPE_ID.size)
+        if baselineSeq:
+            baseline = self._states.get(baselineSeq)
+            if baseline is None:
+                raise ValueError(f'unknown baseline frame: {baselineSeq}')
+            state = dict(baseline)
+        else:
+            state = dict()
+
+        items = list()
+        offset = _TYPE_ID.size + _SEQUENCE.size
+        while offset < len(frame):
+            typeId = frame[offset]
+            offset += 1
+            if typeId == codec.FALLBACK_TYPE:
+                length, offset = _readVarint(frame, offset)
+                item = codec.decodeTelemetry(frame[offset:offset + length])
+                items.append([item["type"], item["value"]])
+                offset += length
+                continue
+
+            msgType = self._typesById[typeId & ~codec.DELTA_FLAG]
+            scales = codec.SCALES[msgType]
+            index, offset = _readVarint(frame, offset)
+            values = list()
+            for _ in scales:
+                value, offset = _readVarint(frame, offset)
+                values.append(value)
+            if typeId & codec.DELTA_FLAG:
+                values = [value + previous for value, previous in zip(values, state[(msgType, index)])]
+            state[(msgType, index)] = tuple(values)
+            items.append([msgType, [index] + [value / scale for value, scale in zip(values, scales)]])
+
+        self._states[seq] = state
+        self._states.pop(seq - codec.HISTORY, None)
+        return seq, items